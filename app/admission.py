@@ -0,0 +1,133 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# Upper bound for client-supplied X-Request-Timeout values (seconds)
+MAX_REQUEST_TIMEOUT = float(os.getenv("MAX_REQUEST_TIMEOUT", "60"))
+
+
+class AdmissionError(Exception):
+    """Raised when a request cannot be served in time; rendered with Retry-After by main.py."""
+    status_code = 503
+
+    def __init__(self, detail: str, retry_after: int = 1):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Overloaded(AdmissionError):
+    """The route's concurrency slots and wait queue are full."""
+    status_code = 503
+
+
+class DeadlineExceeded(AdmissionError):
+    """The request's deadline ran out before (or while) its backend work ran."""
+    status_code = 504
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def from_header(cls, value, default: float) -> "Deadline":
+        """Build a deadline from an X-Request-Timeout header (seconds), clamped to sane bounds."""
+        seconds = default if value is None else value
+        return cls(min(max(float(seconds), 0.0), MAX_REQUEST_TIMEOUT))
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, what: str = "request"):
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline exceeded before {what} could run")
+
+
+class ConcurrencyLimiter:
+    """
+    Per-route concurrency limit with a bounded wait queue.
+    Requests beyond `max_concurrent` wait for a slot until their deadline (504 if it
+    runs out first); once `max_queue` requests are already waiting, new ones are
+    rejected immediately (503).
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, retry_after: int = 1):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._slots = threading.Semaphore(max_concurrent)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def admit(self, deadline: Deadline = None):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    raise Overloaded(f"{self.name} is overloaded, try again later", self.retry_after)
+                self.waiting += 1
+            try:
+                timeout = deadline.remaining() if deadline else None
+                acquired = self._slots.acquire(timeout=timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            if not acquired:
+                with self._lock:
+                    self.rejected += 1
+                raise DeadlineExceeded(f"{self.name} queue wait exceeded the request deadline", self.retry_after)
+
+        with self._lock:
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+        }
+
+
+# ---------- Route limiters ----------
+# The routes are sync, so every running or queued request holds one of AnyIO's worker
+# threads (40 by default) while it waits. Concurrency + queue across all limiters is kept
+# to half the pool so /impute and the model step of /predict always find a free thread.
+WORKER_THREADS = 40
+
+risk_events_limiter = ConcurrencyLimiter(
+    "risk_events",
+    max_concurrent=int(os.getenv("RISK_EVENTS_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("RISK_EVENTS_MAX_QUEUE", "4")),
+)
+emissions_limiter = ConcurrencyLimiter(
+    "emissions",
+    max_concurrent=int(os.getenv("EMISSIONS_MAX_CONCURRENCY", "4")),
+    max_queue=int(os.getenv("EMISSIONS_MAX_QUEUE", "2")),
+    retry_after=5,
+)
+
+_held_threads = sum(l.max_concurrent + l.max_queue for l in (risk_events_limiter, emissions_limiter))
+if _held_threads > WORKER_THREADS // 2:
+    print(f"[admission] warning: limiters can hold {_held_threads} of {WORKER_THREADS} worker threads")
+
+# Default deadlines (seconds) when the client sends no X-Request-Timeout
+PREDICT_TIMEOUT = float(os.getenv("PREDICT_TIMEOUT", "10"))
+RISK_HEATMAP_TIMEOUT = float(os.getenv("RISK_HEATMAP_TIMEOUT", "20"))
+EMISSIONS_TIMEOUT = float(os.getenv("EMISSIONS_TIMEOUT", "30"))
@@ -1,58 +1,111 @@
 import math
 import pandas as pd
+from google.api_core import exceptions as api_exceptions
 from google.cloud import bigquery
+from app.admission import DeadlineExceeded
+from app import query_planner
+from app.query_planner import FilterBuilder, RISK_TABLE
 
 client = bigquery.Client()
 
-def fetch_risk_events(state=None, county=None, season=None, doy=None, risk=None, limit=None):
+
+def run_query(bq_client, query, job_config=None, deadline=None, route=None):
     """
-    Fetch wildfire events with adaptive sample size.
-    If limit is not provided, compute n adaptively based on risk + doy.
+    Run a query and return a DataFrame.
+    With a route, the query is dry-run against that route's scan budget first and the
+    bytes it processed are recorded (see app/query_planner.py).
+    With a deadline, the remaining time bounds the dry run, the BigQuery job timeout and
+    the client-side wait; a job that outlives it is cancelled and DeadlineExceeded is raised.
     """
-    # --- Step 1: adaptive limit ---
-    if not limit:
-        # normalize risk (0–10 scale assumed)
-        r_norm = min((risk or 5) / 10.0, 1.0)
-        # seasonality curve (peaks mid-year)
-        s_norm = (math.sin(2 * math.pi * (doy or 180) / 365.0) + 1) / 2
-        base, max_n = 50, 1000
-        alpha, beta = 0.6, 0.4
-        limit = base + int((alpha * r_norm + beta * s_norm) * (max_n - base))
-        limit = min(max_n, max(base, limit))
+    if deadline is not None:
+        deadline.check("query")
 
-    # --- Step 2: query ---
-    query = """
-    SELECT latitude, longitude, state, county, risk, season, doy
-    FROM `code-for-planet.data_housee.featured_data_risk_csv`
-    WHERE risk IS NOT NULL
-    """
+    if route:
+        timeout = deadline.remaining() if deadline is not None else None
+        try:
+            query_planner.check_budget(bq_client, route, query, job_config, timeout=timeout)
+        except (TimeoutError, api_exceptions.DeadlineExceeded):
+            raise DeadlineExceeded("BigQuery dry run did not finish before the request deadline")
+
+    if deadline is None:
+        job = bq_client.query(query, job_config=job_config)
+        rows = job.result()
+    else:
+        deadline.check("query")
+        job_config = job_config or bigquery.QueryJobConfig()
+        job_config.job_timeout_ms = max(1, int(deadline.remaining() * 1000))
+
+        job = bq_client.query(query, job_config=job_config, timeout=deadline.remaining())
+        try:
+            rows = job.result(timeout=deadline.remaining())
+        except (TimeoutError, api_exceptions.DeadlineExceeded):
+            job.cancel()
+            raise DeadlineExceeded("BigQuery job did not finish before the request deadline")
+
+    if route:
+        query_planner.record_scan(route, job.total_bytes_processed)
+    return rows.to_dataframe()
+
+
+def adaptive_limit(risk=None, doy=None):
+    """Sample size for fetch_risk_events, computed adaptively from risk + doy."""
+    # normalize risk (0–10 scale assumed)
+    r_norm = min((risk or 5) / 10.0, 1.0)
+    # seasonality curve (peaks mid-year)
+    s_norm = (math.sin(2 * math.pi * (doy or 180) / 365.0) + 1) / 2
+    base, max_n = 50, 1000
+    alpha, beta = 0.6, 0.4
+    limit = base + int((alpha * r_norm + beta * s_norm) * (max_n - base))
+    return min(max_n, max(base, limit))
+
+
+def query_risk_events(state=None, county=None, season=None, doy=None, deadline=None):
+    """All risk events matching the filters, before downsampling (a DataFrame)."""
+    # sargable filters on the clustered risk table, only the columns we return
+    filters = FilterBuilder().raw("risk IS NOT NULL")
     if state:
-        query += " AND state = @state"
+        filters.name_eq("state", state)
     if county:
-        query += " AND county = @county"
+        filters.name_eq("county", county)
     if season:
-        query += " AND season = @season"
+        filters.eq("season", int(season), "INT64")
     if doy:
-        query += " AND doy BETWEEN @doy - 7 AND @doy + 7"
+        filters.between("doy", int(doy), 7, "INT64")
 
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("state", "STRING", state),
-            bigquery.ScalarQueryParameter("county", "STRING", county),
-            bigquery.ScalarQueryParameter("season", "INT64", season),
-            bigquery.ScalarQueryParameter("doy", "INT64", doy),
-        ]
-    )
+    query = f"""
+    SELECT latitude, longitude, state, county, risk
+    FROM `{RISK_TABLE}`
+    {filters.where()}
+    """
 
-    df = client.query(query, job_config=job_config).to_dataframe()
+    return run_query(client, query, filters.job_config(), deadline, route="risk_events")
 
-    # --- Step 3: downsample if needed ---
+
+def downsample_risk_events(df, limit):
+    """Stratified sample of at most ~limit events across low/med/high risk bins, as records."""
     if len(df) > limit:
         bins = [0, 3, 6, 10]
-        df["risk_bin"] = pd.cut(df["risk"], bins=bins, labels=["low", "med", "high"], include_lowest=True)
+        df = df.assign(risk_bin=pd.cut(df["risk"], bins=bins, labels=["low", "med", "high"], include_lowest=True))
         df = (
             df.groupby("risk_bin", group_keys=False, observed=False)
             .apply(lambda x: x.sample(n=min(limit // 3, len(x)), random_state=42), include_groups=False)
         )
 
     return df[["latitude", "longitude", "state", "county", "risk"]].to_dict(orient="records")
+
+
+def fetch_risk_events(state=None, county=None, season=None, doy=None, risk=None, limit=None, deadline=None):
+    """
+    Fetch wildfire events with adaptive sample size.
+    If limit is not provided, compute n adaptively based on risk + doy.
+    If deadline is provided, the query is bounded by it (see run_query).
+    """
+    # --- Step 1: adaptive limit ---
+    if not limit:
+        limit = adaptive_limit(risk, doy)
+
+    # --- Step 2: query ---
+    df = query_risk_events(state, county, season, doy, deadline=deadline)
+
+    # --- Step 3: downsample if needed ---
+    return downsample_risk_events(df, limit)
@@ -0,0 +1,73 @@
+"""
+Build partitioned + clustered copies of the BigQuery tables the API reads.
+
+The copies add state_norm / county_norm columns, which hold the same normalization
+app/query_planner.py applies to request parameters. Name filters then compare
+cluster keys instead of wrapping the column in UPPER(). The API queries the copies
+and will not start until they exist, so run this before deploying.
+
+Example:
+    python -m app.build_clustered_tables --print-only
+    python -m app.build_clustered_tables
+"""
+import argparse
+from google.cloud import bigquery
+
+from app.query_planner import (
+    normalized_name_sql,
+    RISK_SOURCE_TABLE, RISK_CLUSTERED_TABLE,
+    EMISSIONS_SOURCE_TABLE, EMISSIONS_CLUSTERED_TABLE,
+)
+
+TABLES = [
+    {
+        # fetch_risk_events: state/county/season equality + doy ±7 window
+        "source": RISK_SOURCE_TABLE,
+        "target": RISK_CLUSTERED_TABLE,
+        "partition": ("doy", 1, 374, 7),
+        "cluster": ["state_norm", "county_norm", "season"],
+    },
+    {
+        # /api/emissions*: year equality + state/county/intensity/size filters
+        "source": EMISSIONS_SOURCE_TABLE,
+        "target": EMISSIONS_CLUSTERED_TABLE,
+        "partition": ("year", 2000, 2031, 1),
+        "cluster": ["state_norm", "county_norm", "emission_intensity", "size_category"],
+    },
+]
+
+
+def build_ddl(source, target, partition, cluster):
+    column, start, end, step = partition
+    return f"""
+    CREATE OR REPLACE TABLE `{target}`
+    PARTITION BY RANGE_BUCKET({column}, GENERATE_ARRAY({start}, {end}, {step}))
+    CLUSTER BY {', '.join(cluster)}
+    AS
+    SELECT
+        * EXCEPT ({column}),
+        CAST({column} AS INT64) AS {column},
+        {normalized_name_sql("state")} AS state_norm,
+        {normalized_name_sql("county")} AS county_norm
+    FROM `{source}`
+    """
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build clustered/partitioned copies of the API tables")
+    parser.add_argument("--print-only", action="store_true", help="Print the DDL without running it")
+    args = parser.parse_args()
+
+    client = None if args.print_only else bigquery.Client()
+    for table in TABLES:
+        ddl = build_ddl(**table)
+        print(ddl)
+        if client is None:
+            continue
+        job = client.query(ddl)
+        job.result()
+        print(f"Built {table['target']} from {table['source']} ({job.total_bytes_processed} bytes processed)")
+
+
+if __name__ == "__main__":
+    main()
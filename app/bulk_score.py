@@ -0,0 +1,148 @@
+"""
+Offline bulk scoring: parquet in, parquet out.
+
+Each input row is imputed with WildfireImputer and scored with xgb_best_model (duration)
+and xgb_hazard_model (end-tomorrow probability); map_duration_to_risk gives adjusted_risk.
+Work is split into (shard, row group) units spread across a process pool. Models are
+loaded once in the parent and shared read-only with forked workers (copy-on-write).
+
+Every unit writes its own output file, so an interrupted run can be resumed with --resume.
+
+Example:
+    python -m app.bulk_score gs://data_housee/wildfire_ml_data/featured_data_with_risk_parquet/ \
+        --out gs://data_housee/wildfire_ml_data/scored/ --workers 8 --resume
+"""
+import os
+import time
+import hashlib
+import argparse
+import multiprocessing as mp
+import fsspec
+import pandas as pd
+import pyarrow.parquet as pq
+
+from app.scoring import score_frame
+
+# Set in the parent before the pool forks; workers reuse them without reloading
+_imputer = None
+_duration_model = None
+_hazard_model = None
+
+
+def load_models():
+    global _imputer, _duration_model, _hazard_model
+    if _imputer is None:
+        from app.imputer import wildfire_imputer
+        from app.model_download import xgb_best_model, xgb_hazard_model
+        _imputer, _duration_model, _hazard_model = wildfire_imputer, xgb_best_model, xgb_hazard_model
+
+
+def list_shards(inputs):
+    """Expand files, directories and globs (local or gs://) into parquet paths."""
+    shards = []
+    for spec in inputs:
+        fs, path = fsspec.core.url_to_fs(spec)
+        if fs.isdir(path):
+            paths = fs.glob(path.rstrip("/") + "/**/*.parquet")
+        elif any(ch in path for ch in "*?["):
+            paths = fs.glob(path)
+        else:
+            paths = [path]
+        shards.extend(fs.unstrip_protocol(p) for p in sorted(paths))
+    return shards
+
+
+def plan_units(shards):
+    """One unit per (shard, row group)."""
+    units = []
+    for shard in shards:
+        with fsspec.open(shard, "rb") as f:
+            metadata = pq.ParquetFile(f).metadata
+        for row_group in range(metadata.num_row_groups):
+            units.append((shard, row_group, metadata.row_group(row_group).num_rows))
+    return units
+
+
+def unit_output_path(out_dir, shard, row_group):
+    # shards in different directories often share a basename (part-0.parquet), so the
+    # name carries a hash of the full shard URL; it is stable across runs for --resume
+    stem = os.path.splitext(os.path.basename(shard))[0]
+    shard_id = hashlib.sha1(shard.encode()).hexdigest()[:10]
+    return f"{out_dir.rstrip('/')}/{stem}-{shard_id}-rg{row_group:05d}.parquet"
+
+
+def score_unit(args):
+    """Impute + score one row group in chunks and write it atomically (tmp file, then rename)."""
+    shard, row_group, out_path, chunk_size, round_risk = args
+    load_models()
+
+    with fsspec.open(shard, "rb") as f:
+        parquet = pq.ParquetFile(f)
+        parts = []
+        for batch in parquet.iter_batches(batch_size=chunk_size, row_groups=[row_group]):
+            chunk = batch.to_pandas()
+            imputed = _imputer.transform_frame(chunk, round_risk=round_risk)
+            scores = score_frame(imputed, _duration_model, _hazard_model)
+            parts.append(chunk.reset_index(drop=True).join(scores))
+
+    result = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+    fs, path = fsspec.core.url_to_fs(out_path)
+    # "_" prefix keeps half-written files out of parquet dataset reads
+    tmp_path = f"{os.path.dirname(path)}/_{os.path.basename(path)}.tmp"
+    with fs.open(tmp_path, "wb") as f:
+        result.to_parquet(f, index=False)
+    fs.mv(tmp_path, path)
+    return len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-score parquet shards through the imputer and both models")
+    parser.add_argument("inputs", nargs="+", help="Parquet files, directories or globs (local or gs://)")
+    parser.add_argument("--out", required=True, help="Output directory (local or gs://)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows imputed/scored per batch")
+    parser.add_argument("--round-risk", action="store_true")
+    parser.add_argument("--resume", action="store_true", help="Skip units whose output already exists")
+    args = parser.parse_args()
+
+    shards = list_shards(args.inputs)
+    if not shards:
+        raise RuntimeError(f"No parquet files found in {args.inputs}")
+    units = plan_units(shards)
+    total_rows = sum(n for _, _, n in units)
+    print(f"Found {len(shards)} shards, {len(units)} row groups, {total_rows} rows")
+
+    out_fs, out_root = fsspec.core.url_to_fs(args.out)
+    out_fs.makedirs(out_root, exist_ok=True)
+
+    todo = []
+    for shard, row_group, n_rows in units:
+        out_path = unit_output_path(args.out, shard, row_group)
+        if args.resume and out_fs.exists(fsspec.core.url_to_fs(out_path)[1]):
+            total_rows -= n_rows
+            continue
+        todo.append((shard, row_group, out_path, args.chunk_size, args.round_risk))
+    if args.resume:
+        print(f"Resuming: {len(units) - len(todo)} row groups already scored, {len(todo)} to go")
+
+    # Load once in the parent so forked workers share the model memory
+    load_models()
+    ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+
+    start = time.perf_counter()
+    done_rows = 0
+    with ctx.Pool(processes=args.workers) as pool:
+        for i, n in enumerate(pool.imap_unordered(score_unit, todo), start=1):
+            done_rows += n
+            elapsed = time.perf_counter() - start
+            print(f"[{i}/{len(todo)}] {done_rows}/{total_rows} rows "
+                  f"({done_rows / elapsed:,.0f} rows/s, {elapsed:.0f}s elapsed)")
+
+    elapsed = time.perf_counter() - start
+    print(f"Scored {done_rows} rows in {elapsed:.1f}s "
+          f"({done_rows / elapsed if elapsed else 0:,.0f} rows/s) -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import os
+import sys
+import hmac
+import time
+import uuid
+import random
+import threading
+import tracemalloc
+from collections import Counter, deque
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+# Diagnostics are off unless an admin token is configured
+DIAGNOSTICS_TOKEN = os.getenv("DIAGNOSTICS_TOKEN")
+# Share of ordinary requests profiled at random, e.g. 0.001 for 0.1%
+DIAGNOSTICS_SAMPLE_RATE = float(os.getenv("DIAGNOSTICS_SAMPLE_RATE", "0"))
+DIAGNOSTICS_INTERVAL_MS = float(os.getenv("DIAGNOSTICS_INTERVAL_MS", "5"))
+DIAGNOSTICS_BUFFER_SIZE = int(os.getenv("DIAGNOSTICS_BUFFER_SIZE", "20"))
+DIAGNOSTICS_TOP_ALLOCATIONS = 25
+# Stack depth tracemalloc records per allocation in memory mode; every extra frame
+# slows allocation-heavy code further
+DIAGNOSTICS_TRACE_FRAMES = int(os.getenv("DIAGNOSTICS_TRACE_FRAMES", "1"))
+# A new peak snapshot is taken once traced memory grows this much past the last one
+SNAPSHOT_GROWTH = 1.2
+
+# "cpu": sampled stacks only. "memory": allocation tracing only (tracemalloc slows the
+# request too much for its timings or stacks to mean anything)
+MODES = ("cpu", "memory")
+
+router = APIRouter()
+
+reports = deque(maxlen=DIAGNOSTICS_BUFFER_SIZE)
+# tracemalloc and the sampler are process-wide, so only one request is traced at a time
+_trace_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(DIAGNOSTICS_TOKEN)
+
+
+def _token_ok(token: Optional[str]) -> bool:
+    # constant-time comparison so the token can't be guessed from response timing
+    return token is not None and hmac.compare_digest(token.encode(), DIAGNOSTICS_TOKEN.encode())
+
+
+def profile_reason(request: Request) -> Optional[str]:
+    """Why this request should be traced ("header" / "sampled"), or None."""
+    if not enabled() or request.url.path.startswith("/admin"):
+        return None
+    if _token_ok(request.headers.get("x-diagnostics-token")):
+        return "header"
+    if DIAGNOSTICS_SAMPLE_RATE > 0 and random.random() < DIAGNOSTICS_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+def profile_mode(request: Request, reason: str) -> str:
+    """Mode picked by the X-Diagnostics-Mode header on token requests; sampled requests get "cpu"."""
+    mode = request.headers.get("x-diagnostics-mode", "cpu").lower() if reason == "header" else "cpu"
+    return mode if mode in MODES else "cpu"
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples thread stacks every `interval` seconds and counts them in folded
+    (flamegraph.pl / speedscope) format. Only stacks running the request's
+    endpoint function are kept, so unrelated work is left out. Concurrent requests
+    to the same endpoint share its code object, so their stacks are merged into the
+    report as well.
+    """
+
+    def __init__(self, scope, interval):
+        super().__init__(name="diagnostics-sampler", daemon=True)
+        self.scope = scope
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_ident = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            # the router stores the matched endpoint in the scope once routing is done
+            code = getattr(self.scope.get("endpoint"), "__code__", None)
+            if code is None:
+                continue
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                names, keep = [], False
+                while frame is not None:
+                    keep = keep or frame.f_code is code
+                    names.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                if keep:
+                    self.stacks[";".join(reversed(names))] += 1
+                    self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class PeakSnapshotter(threading.Thread):
+    """
+    Polls traced memory while the request runs and keeps a snapshot taken near its
+    peak. A snapshot taken after the response would only show what survived the
+    request, not where it allocated.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name="diagnostics-snapshotter", daemon=True)
+        self.interval = interval
+        self.snapshot = None
+        self.snapshot_size = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            current, _ = tracemalloc.get_traced_memory()
+            if current > self.snapshot_size * SNAPSHOT_GROWTH:
+                self.snapshot = tracemalloc.take_snapshot()
+                self.snapshot_size = current
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def top_allocations(self):
+        if self.snapshot is None:
+            return []
+        snapshot = self.snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, __file__),
+        ])
+        return [
+            {
+                "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_kb": round(stat.size / 1024, 1),
+                "count": stat.count,
+            }
+            for stat in snapshot.statistics("lineno")[:DIAGNOSTICS_TOP_ALLOCATIONS]
+        ]
+
+
+class RequestTrace:
+    """Sampling CPU profile or allocation trace around one request, depending on `mode`."""
+
+    def __init__(self, request: Request, reason: str, mode: str = "cpu"):
+        self.request = request
+        self.reason = reason
+        self.mode = mode
+        interval = DIAGNOSTICS_INTERVAL_MS / 1000.0
+        if mode == "memory":
+            self.profiler = PeakSnapshotter(interval)
+        else:
+            self.profiler = StackSampler(request.scope, interval)
+        self.report_id = uuid.uuid4().hex[:12]
+
+    def start(self):
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        if self.mode == "memory":
+            tracemalloc.start(DIAGNOSTICS_TRACE_FRAMES)
+        self.profiler.start()
+
+    def finish(self, status_code: Optional[int]) -> dict:
+        self.profiler.stop()
+        duration_ms = 1000 * (time.perf_counter() - self._t0)
+
+        memory, top, stacks, samples = None, [], {}, 0
+        if self.mode == "memory":
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            memory = {
+                "traced_kb": round(current / 1024, 1),
+                "peak_kb": round(peak / 1024, 1),
+                "snapshot_kb": round(self.profiler.snapshot_size / 1024, 1),
+            }
+            top = self.profiler.top_allocations()
+        else:
+            stacks = dict(self.profiler.stacks.most_common())
+            samples = self.profiler.samples
+
+        report = {
+            "id": self.report_id,
+            "method": self.request.method,
+            "path": self.request.url.path,
+            "query": str(self.request.url.query),
+            "reason": self.reason,
+            "mode": self.mode,
+            "status_code": status_code,
+            "started_at": self.started_at,
+            "duration_ms": round(duration_ms, 2),
+            "samples": samples,
+            "interval_ms": DIAGNOSTICS_INTERVAL_MS,
+            "memory": memory,
+            "top_allocations": top,
+            "folded_stacks": stacks,
+        }
+        reports.append(report)
+        return report
+
+
+async def diagnostics_middleware(request: Request, call_next):
+    """Profile the request if asked to (admin token header) or picked by random sampling."""
+    reason = profile_reason(request)
+    if reason is None or not _trace_lock.acquire(blocking=False):
+        return await call_next(request)
+
+    trace = RequestTrace(request, reason, profile_mode(request, reason))
+    status_code = None
+    try:
+        trace.start()
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers["X-Diagnostics-Report"] = trace.report_id
+        return response
+    finally:
+        try:
+            trace.finish(status_code)
+        finally:
+            _trace_lock.release()
+
+
+# ---------- Admin endpoints ----------
+def _require_admin(token: Optional[str]):
+    # 404 rather than 401 so the surface is invisible when diagnostics are off
+    if not enabled():
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not _token_ok(token):
+        raise HTTPException(status_code=401, detail="Invalid diagnostics token")
+
+
+def _find_report(report_id: str) -> dict:
+    for report in reports:
+        if report["id"] == report_id:
+            return report
+    raise HTTPException(status_code=404, detail=f"Report {report_id} not found (buffer keeps the last {reports.maxlen})")
+
+
+@router.get("/diagnostics")
+def list_reports(x_diagnostics_token: Optional[str] = Header(None)):
+    """List stored request diagnostics, newest first."""
+    _require_admin(x_diagnostics_token)
+    summaries = [
+        {k: r[k] for k in ["id", "method", "path", "reason", "mode", "status_code", "started_at", "duration_ms", "samples"]}
+        | {"peak_kb": r["memory"]["peak_kb"] if r["memory"] else None}
+        for r in reversed(reports)
+    ]
+    return {"reports": summaries, "count": len(summaries), "capacity": reports.maxlen,
+            "sample_rate": DIAGNOSTICS_SAMPLE_RATE}
+
+
+@router.get("/diagnostics/{report_id}")
+def get_report(report_id: str, x_diagnostics_token: Optional[str] = Header(None)):
+    """Full report: folded stacks (cpu mode) or top allocations and memory peak (memory mode)."""
+    _require_admin(x_diagnostics_token)
+    return _find_report(report_id)
+
+
+@router.get("/diagnostics/{report_id}/flamegraph", response_class=PlainTextResponse)
+def get_flamegraph(report_id: str, x_diagnostics_token: Optional[str] = Header(None)):
+    """Folded stacks (`frame;frame;frame count`) for flamegraph.pl or speedscope."""
+    _require_admin(x_diagnostics_token)
+    report = _find_report(report_id)
+    return "\n".join(f"{stack} {count}" for stack, count in report["folded_stacks"].items())
@@ -1,15 +1,20 @@
-from fastapi import APIRouter, Query, HTTPException
+from fastapi import APIRouter, Query, HTTPException, Request, Header
 from typing import Optional
 from google.cloud import bigquery
 import pandas as pd
 import gcsfs
 import json
+from app.http_cache import RefreshingCache, cached_response
+from app.admission import AdmissionError, Deadline, emissions_limiter, EMISSIONS_TIMEOUT
+from app.bigquery_utils import run_query
+from app.query_planner import FilterBuilder, EMISSIONS_TABLE
 
 router = APIRouter()
 bq_client = bigquery.Client()
+gcs_fs = gcsfs.GCSFileSystem()
 
 SAMPLE_JSON_PATH = "data_housee/wildfire_ml_models/ml_charts/wildfire_emissions_sample.json"
-TABLE = "code-for-planet.data_housee.wildfire_event_emissions_clean"
+TABLE = EMISSIONS_TABLE
 
 
 @router.get("/emissions")
@@ -19,34 +24,30 @@ def get_emissions(
         year: Optional[int] = Query(None),
         emission_intensity: Optional[str] = Query(None),
         size_category: Optional[str] = Query(None),
-        limit: int = Query(10000, ge=1, le=1028764)
+        limit: int = Query(10000, ge=1, le=1028764),
+        x_request_timeout: Optional[float] = Header(None)
 ):
     """Retrieve wildfire emission events with optional filters."""
 
-    filters = []
-    params = []
+    filters = FilterBuilder()
 
     if state:
-        filters.append("UPPER(state) = UPPER(@state)")
-        params.append(bigquery.ScalarQueryParameter("state", "STRING", state))
+        filters.name_eq("state", state)
 
+    # county is a substring match on the normalized name ("los angeles" matches "LOS ANGELES")
     if county and state:
-        filters.append("UPPER(county) LIKE UPPER(@county)")
-        params.append(bigquery.ScalarQueryParameter("county", "STRING", f"%{county}%"))
+        filters.name_contains("county", county)
 
     if year:
-        filters.append("year = @year")
-        params.append(bigquery.ScalarQueryParameter("year", "INT64", year))
+        filters.eq("year", year, "INT64")
 
     if emission_intensity and emission_intensity.lower() in ['low', 'medium', 'high', 'very_high']:
-        filters.append("emission_intensity = @emission_intensity")
-        params.append(bigquery.ScalarQueryParameter("emission_intensity", "STRING", emission_intensity.lower()))
+        filters.eq("emission_intensity", emission_intensity.lower(), "STRING")
 
     if size_category and size_category.lower() in ['small', 'medium', 'large', 'very_large']:
-        filters.append("size_category = @size_category")
-        params.append(bigquery.ScalarQueryParameter("size_category", "STRING", size_category.lower()))
+        filters.eq("size_category", size_category.lower(), "STRING")
 
-    where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
+    where_clause = filters.where()
 
     # Separate queries for better reliability
     events_query = f"""
@@ -75,9 +76,10 @@ def get_emissions(
     LIMIT {limit}
     """
 
+    deadline = Deadline.from_header(x_request_timeout, EMISSIONS_TIMEOUT)
     try:
-        job_config = bigquery.QueryJobConfig(query_parameters=params) if params else None
-        df = bq_client.query(events_query, job_config=job_config).to_dataframe()
+        with emissions_limiter.admit(deadline):
+            df = run_query(bq_client, events_query, filters.job_config(), deadline, route="emissions")
 
         if df.empty:
             return {
@@ -132,24 +134,43 @@ def get_emissions(
             "summary": summary
         }
 
+    except (AdmissionError, HTTPException):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving emission data: {str(e)}")
 
 
+def _sample_generation():
+    """GCS generation of the sample object; changes whenever the object is rewritten."""
+    gcs_fs.invalidate_cache(SAMPLE_JSON_PATH)
+    return gcs_fs.info(SAMPLE_JSON_PATH).get("generation")
+
+
+def _load_emissions_sample():
+    with gcs_fs.open(SAMPLE_JSON_PATH, "r") as f:
+        data = json.load(f)
+
+    return {
+        "message": f"Loaded {data.get('count', len(data.get('events', [])))} sample emission events",
+        "events": data.get("events", []),
+        "count": data.get("count", len(data.get("events", [])))
+    }
+
+
+def _table_modified():
+    """Last-modified timestamp of the emissions table (metadata call, no query cost)."""
+    return bq_client.get_table(TABLE).modified
+
+
+sample_cache = RefreshingCache(_load_emissions_sample, version_fn=_sample_generation)
+
+
 @router.get("/emissions/sample")
-def get_emissions_sample():
+def get_emissions_sample(request: Request):
     """Retrieve pre-sampled 5000 wildfire emission events from GCS JSON."""
 
     try:
-        fs = gcsfs.GCSFileSystem()
-        with fs.open(SAMPLE_JSON_PATH, "r") as f:
-            data = json.load(f)
-
-        return {
-            "message": f"Loaded {data.get('count', len(data.get('events', [])))} sample emission events",
-            "events": data.get("events", []),
-            "count": data.get("count", len(data.get("events", [])))
-        }
+        return cached_response(request, sample_cache.get())
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error loading emission sample: {str(e)}")
@@ -158,22 +179,20 @@ def get_emissions_sample():
 @router.get("/emissions/summary")
 def get_emissions_summary(
         state: Optional[str] = Query(None),
-        year: Optional[int] = Query(None)
+        year: Optional[int] = Query(None),
+        x_request_timeout: Optional[float] = Header(None)
 ):
     """Get aggregated emissions summary by state and year."""
 
-    filters = []
-    params = []
+    filters = FilterBuilder()
 
     if state:
-        filters.append("UPPER(state) = UPPER(@state)")
-        params.append(bigquery.ScalarQueryParameter("state", "STRING", state))
+        filters.name_eq("state", state)
 
     if year:
-        filters.append("year = @year")
-        params.append(bigquery.ScalarQueryParameter("year", "INT64", year))
+        filters.eq("year", year, "INT64")
 
-    where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
+    where_clause = filters.where()
 
     query = f"""
     SELECT 
@@ -199,9 +218,10 @@ def get_emissions_summary(
     LIMIT 500
     """
 
+    deadline = Deadline.from_header(x_request_timeout, EMISSIONS_TIMEOUT)
     try:
-        job_config = bigquery.QueryJobConfig(query_parameters=params) if params else None
-        df = bq_client.query(query, job_config=job_config).to_dataframe()
+        with emissions_limiter.admit(deadline):
+            df = run_query(bq_client, query, filters.job_config(), deadline, route="emissions_summary")
 
         if df.empty:
             return {"message": "No summary data found", "data": [], "count": 0}
@@ -226,14 +246,13 @@ def get_emissions_summary(
             "count": len(data)
         }
 
+    except (AdmissionError, HTTPException):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving summary: {str(e)}")
 
 
-@router.get("/emissions/states")
-def get_available_states():
-    """Get list of available states with emission statistics."""
-
+def _load_available_states():
     query = f"""
     SELECT 
         state,
@@ -248,30 +267,44 @@ def get_available_states():
     ORDER BY total_emissions DESC
     """
 
-    try:
-        df = bq_client.query(query).to_dataframe()
+    df = run_query(bq_client, query, route="emissions_states")
 
-        states = []
-        for _, row in df.iterrows():
-            states.append({
-                "state": row["state"],
-                "event_count": int(row["event_count"]),
-                "year_range": f"{int(row['first_year'])}-{int(row['last_year'])}",
-                "total_emissions": row["total_emissions"],
-                "avg_emission_value": row["avg_emission_value"],
-                "high_impact_events": int(row["high_impact_events"])
-            })
+    states = []
+    for _, row in df.iterrows():
+        states.append({
+            "state": row["state"],
+            "event_count": int(row["event_count"]),
+            "year_range": f"{int(row['first_year'])}-{int(row['last_year'])}",
+            "total_emissions": row["total_emissions"],
+            "avg_emission_value": row["avg_emission_value"],
+            "high_impact_events": int(row["high_impact_events"])
+        })
+
+    return {"states": states, "count": len(states)}
 
-        return {"states": states, "count": len(states)}
 
+states_cache = RefreshingCache(_load_available_states, version_fn=_table_modified)
+
+
+@router.get("/emissions/states")
+def get_available_states(request: Request):
+    """Get list of available states with emission statistics."""
+
+    try:
+        return cached_response(request, states_cache.get())
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving states: {str(e)}")
 
 
 @router.get("/emissions/counties")
-def get_available_counties(state: str = Query(...)):
+def get_available_counties(state: str = Query(...), x_request_timeout: Optional[float] = Header(None)):
     """Get list of available counties for a specific state."""
 
+    filters = FilterBuilder().name_eq("state", state)
+
     query = f"""
     SELECT 
         county,
@@ -280,16 +313,15 @@ def get_available_counties(state: str = Query(...)):
         ROUND(AVG(duration_days), 2) as avg_duration,
         COUNTIF(emission_intensity = 'very_high') as high_impact_events
     FROM `{TABLE}`
-    WHERE UPPER(state) = UPPER(@state)
+    {filters.where()}
     GROUP BY county
     ORDER BY total_emissions DESC
     """
 
+    deadline = Deadline.from_header(x_request_timeout, EMISSIONS_TIMEOUT)
     try:
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[bigquery.ScalarQueryParameter("state", "STRING", state)]
-        )
-        df = bq_client.query(query, job_config=job_config).to_dataframe()
+        with emissions_limiter.admit(deadline):
+            df = run_query(bq_client, query, filters.job_config(), deadline, route="emissions_counties")
 
         counties = df.to_dict('records')
         for county in counties:
@@ -298,14 +330,13 @@ def get_available_counties(state: str = Query(...)):
 
         return {"state": state, "counties": counties, "count": len(counties)}
 
+    except (AdmissionError, HTTPException):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving counties: {str(e)}")
 
 
-@router.get("/emissions/years")
-def get_available_years():
-    """Get list of available years with comprehensive statistics."""
-
+def _load_available_years():
     query = f"""
     SELECT 
         year,
@@ -321,48 +352,65 @@ def get_available_years():
     ORDER BY year DESC
     """
 
-    try:
-        df = bq_client.query(query).to_dataframe()
+    df = run_query(bq_client, query, route="emissions_years")
 
-        years = df.to_dict('records')
-        for year_data in years:
-            year_data['event_count'] = int(year_data['event_count'])
-            year_data['states_affected'] = int(year_data['states_affected'])
-            year_data['very_high_events'] = int(year_data['very_high_events'])
-            year_data['large_fires'] = int(year_data['large_fires'])
+    years = df.to_dict('records')
+    for year_data in years:
+        year_data['event_count'] = int(year_data['event_count'])
+        year_data['states_affected'] = int(year_data['states_affected'])
+        year_data['very_high_events'] = int(year_data['very_high_events'])
+        year_data['large_fires'] = int(year_data['large_fires'])
 
-        year_values = [y["year"] for y in years]
+    year_values = [y["year"] for y in years]
 
-        return {
-            "years": years,
-            "count": len(years),
-            "range": {
-                "min": min(year_values) if year_values else None,
-                "max": max(year_values) if year_values else None
-            }
+    return {
+        "years": years,
+        "count": len(years),
+        "range": {
+            "min": min(year_values) if year_values else None,
+            "max": max(year_values) if year_values else None
         }
+    }
+
 
+years_cache = RefreshingCache(_load_available_years, version_fn=_table_modified)
+
+
+@router.get("/emissions/years")
+def get_available_years(request: Request):
+    """Get list of available years with comprehensive statistics."""
+
+    try:
+        return cached_response(request, years_cache.get())
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving years: {str(e)}")
 
 
+FILTERS = {
+    "filters": {
+        "emission_intensity": ["low", "medium", "high", "very_high"],
+        "size_category": ["small", "medium", "large", "very_large"],
+        "state": "US state name (e.g., CALIFORNIA)",
+        "county": "County name - requires state",
+        "year": "Year (2003-2015)"
+    },
+    "endpoints": {
+        "/emissions": "Get emission events with filters",
+        "/emissions/summary": "Get aggregated summary by state/year",
+        "/emissions/states": "Get available states",
+        "/emissions/counties?state=X": "Get counties for state",
+        "/emissions/years": "Get available years",
+        "/emissions/filters": "Get filter options"
+    }
+}
+
+filters_cache = RefreshingCache(lambda: FILTERS)
+
+
 @router.get("/emissions/filters")
-def get_available_filters():
+def get_available_filters(request: Request):
     """Get all available filter options and endpoint information."""
-    return {
-        "filters": {
-            "emission_intensity": ["low", "medium", "high", "very_high"],
-            "size_category": ["small", "medium", "large", "very_large"],
-            "state": "US state name (e.g., CALIFORNIA)",
-            "county": "County name - requires state",
-            "year": "Year (2003-2015)"
-        },
-        "endpoints": {
-            "/emissions": "Get emission events with filters",
-            "/emissions/summary": "Get aggregated summary by state/year",
-            "/emissions/states": "Get available states",
-            "/emissions/counties?state=X": "Get counties for state",
-            "/emissions/years": "Get available years",
-            "/emissions/filters": "Get filter options"
-        }
-    }
\ No newline at end of file
+    return cached_response(request, filters_cache.get())
@@ -0,0 +1,154 @@
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+import numpy as np
+from fastapi import HTTPException
+from google.api_core import exceptions as api_exceptions
+from google.cloud import storage
+
+# "gcs" shares tracked fires between all instances; "memory" is per instance (local dev only)
+TRACKED_FIRES_STORE = os.getenv("TRACKED_FIRES_STORE", "gcs")
+TRACKED_FIRES_BUCKET = os.getenv("TRACKED_FIRES_BUCKET", "data_housee")
+TRACKED_FIRES_PREFIX = os.getenv("TRACKED_FIRES_PREFIX", "tracked_fires/")
+# Fires kept by the memory store; least recently updated are evicted first
+TRACKED_FIRES_MAX = int(os.getenv("TRACKED_FIRES_MAX", "1000"))
+
+_FIRE_ID = re.compile(r"[0-9a-f]{32}")
+
+
+def _not_found(fire_id):
+    return HTTPException(status_code=404, detail=f"Tracked fire {fire_id} not found")
+
+
+def _conflict(fire_id):
+    return HTTPException(status_code=409, detail=f"Tracked fire {fire_id} was updated concurrently, retry")
+
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def encode_fire(fire) -> bytes:
+    return json.dumps(fire, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+
+def decode_fire(data: bytes) -> dict:
+    fire = json.loads(data)
+    if fire.get("knn_state") is not None:
+        fire["knn_state"] = {key: np.asarray(value) for key, value in fire["knn_state"].items()}
+    return fire
+
+
+class FireStore:
+    """
+    Tracked-fire persistence. `get` returns (fire, version). Passing that version back
+    to `put` makes the write fail with 409 if the fire changed in between; `put`
+    without a version only creates new fires.
+    """
+
+    def _check_id(self, fire_id):
+        # ids are uuid4 hex; anything else can't exist (and must not reach an object path)
+        if not _FIRE_ID.fullmatch(fire_id):
+            raise _not_found(fire_id)
+
+    def get(self, fire_id):
+        raise NotImplementedError
+
+    def put(self, fire_id, fire, version=None):
+        raise NotImplementedError
+
+    def delete(self, fire_id):
+        raise NotImplementedError
+
+
+class MemoryFireStore(FireStore):
+    """In-process LRU of encoded fires; not shared between instances and lost on restart."""
+
+    def __init__(self, max_size=TRACKED_FIRES_MAX):
+        self.max_size = max_size
+        self._fires = OrderedDict()
+        self._versions = 0
+        self._lock = threading.Lock()
+
+    def get(self, fire_id):
+        self._check_id(fire_id)
+        with self._lock:
+            if fire_id not in self._fires:
+                raise _not_found(fire_id)
+            version, data = self._fires[fire_id]
+        return decode_fire(data), version
+
+    def put(self, fire_id, fire, version=None):
+        self._check_id(fire_id)
+        data = encode_fire(fire)
+        with self._lock:
+            current = self._fires.get(fire_id, (None, None))[0]
+            if current != version:
+                raise _conflict(fire_id)
+            self._versions += 1
+            self._fires[fire_id] = (self._versions, data)
+            self._fires.move_to_end(fire_id)
+            while len(self._fires) > self.max_size:
+                self._fires.popitem(last=False)
+
+    def delete(self, fire_id):
+        self._check_id(fire_id)
+        with self._lock:
+            if self._fires.pop(fire_id, None) is None:
+                raise _not_found(fire_id)
+
+    def __len__(self):
+        return len(self._fires)
+
+
+class GCSFireStore(FireStore):
+    """
+    One JSON object per fire under gs://<bucket>/<prefix>, shared by every instance.
+    The object generation is the version, so concurrent updates to one fire are
+    rejected by a generation precondition instead of overwriting each other.
+    """
+
+    def __init__(self, bucket_name=TRACKED_FIRES_BUCKET, prefix=TRACKED_FIRES_PREFIX):
+        self.bucket = storage.Client().bucket(bucket_name)
+        self.prefix = prefix
+
+    def _blob(self, fire_id):
+        self._check_id(fire_id)
+        return self.bucket.blob(f"{self.prefix}{fire_id}.json")
+
+    def get(self, fire_id):
+        blob = self._blob(fire_id)
+        try:
+            data = blob.download_as_bytes()
+        except api_exceptions.NotFound:
+            raise _not_found(fire_id)
+        return decode_fire(data), blob.generation
+
+    def put(self, fire_id, fire, version=None):
+        blob = self._blob(fire_id)
+        try:
+            # generation 0 means "only if the object does not exist yet"
+            blob.upload_from_string(encode_fire(fire), content_type="application/json",
+                                    if_generation_match=version if version is not None else 0)
+        except api_exceptions.PreconditionFailed:
+            raise _conflict(fire_id)
+
+    def delete(self, fire_id):
+        try:
+            self._blob(fire_id).delete()
+        except api_exceptions.NotFound:
+            raise _not_found(fire_id)
+
+
+def make_store(kind=TRACKED_FIRES_STORE) -> FireStore:
+    if kind == "memory":
+        return MemoryFireStore()
+    if kind == "gcs":
+        return GCSFireStore()
+    raise ValueError(f"Unknown TRACKED_FIRES_STORE {kind!r} (expected 'gcs' or 'memory')")
@@ -0,0 +1,135 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+# How long browsers/CDNs may reuse a cached response before revalidating
+CACHE_MAX_AGE = int(os.getenv("CACHE_MAX_AGE", "300"))
+
+# How often we ask the source (GCS object / BigQuery table) whether it changed
+CACHE_CHECK_INTERVAL = int(os.getenv("CACHE_CHECK_INTERVAL", "300"))
+
+
+class CachedPayload:
+    """A JSON response encoded once, with a gzip copy and strong ETags."""
+
+    def __init__(self, data, version=None):
+        self.body = json.dumps(
+            jsonable_encoder(data),
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        self.gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gz"'
+        self.version = version
+
+
+class RefreshingCache:
+    """
+    Holds one CachedPayload built by `loader`.
+    If `version_fn` is given, it is polled at most every `check_interval` seconds and
+    the payload is rebuilt only when the returned version differs from the cached one.
+    Without `version_fn` the payload is built once and kept for the process lifetime.
+    """
+
+    def __init__(self, loader, version_fn=None, check_interval=CACHE_CHECK_INTERVAL):
+        self.loader = loader
+        self.version_fn = version_fn
+        self.check_interval = check_interval
+        self._payload = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> CachedPayload:
+        if self._is_fresh():
+            return self._payload
+        with self._lock:
+            # another thread may have refreshed while we waited
+            if self._is_fresh():
+                return self._payload
+            return self._refresh()
+
+    def _is_fresh(self) -> bool:
+        if self._payload is None:
+            return False
+        if self.version_fn is None:
+            return True
+        return time.monotonic() - self._checked_at < self.check_interval
+
+    def _refresh(self) -> CachedPayload:
+        try:
+            version = self.version_fn() if self.version_fn else None
+            if self._payload is None or version != self._payload.version:
+                self._payload = CachedPayload(self.loader(), version=version)
+        except Exception as e:
+            if self._payload is None:
+                raise
+            # keep serving the last good copy if the source is temporarily unavailable
+            print(f"Cache refresh failed, serving stale payload: {e}")
+        self._checked_at = time.monotonic()
+        return self._payload
+
+    def invalidate(self):
+        with self._lock:
+            self._payload = None
+            self._checked_at = 0.0
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against one ETag (RFC 9110 13.1.2)."""
+    if not if_none_match:
+        return False
+    candidates = {tag.strip() for tag in if_none_match.split(",")}
+    if "*" in candidates:
+        return True
+    candidates = {tag[2:] if tag.startswith("W/") else tag for tag in candidates}
+    return etag in candidates
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip, honoring q-values (q=0 means "not acceptable")."""
+    qvalues = {}
+    for item in (accept_encoding or "").lower().split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding] = q
+    if "gzip" in qvalues:
+        return qvalues["gzip"] > 0
+    return qvalues.get("*", 0) > 0
+
+
+def cached_response(request: Request, payload: CachedPayload, max_age: int = CACHE_MAX_AGE) -> Response:
+    """Serve a CachedPayload honoring If-None-Match and Accept-Encoding."""
+    use_gzip = accepts_gzip(request.headers.get("accept-encoding"))
+    etag = payload.gzip_etag if use_gzip else payload.etag
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}",
+        "Vary": "Accept-Encoding",
+    }
+
+    # only the ETag of the representation being served can validate the client's copy
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=payload.gzipped, media_type="application/json", headers=headers)
+    return Response(content=payload.body, media_type="application/json", headers=headers)
@@ -5,24 +5,178 @@ import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 
 
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def _norm_name(value):
+    return str(value).strip().upper()
+
+
+def _doy_bucket(doy, bucket_days):
+    return int((int(round(float(doy))) - 1) // bucket_days)
+
+
+class SparseLookup:
+    """
+    Precomputed neighbor aggregates for the sparse inputs most callers send:
+      - {state, county, doy}      -> mean features of historical fires in that county and DOY bucket
+      - {latitude, longitude, doy} -> mean features of historical fires in that grid cell and DOY bucket
+    Groups with fewer than `min_count` fires are left out so those inputs fall back to KNN.
+    """
+
+    COUNTY_PATTERN = frozenset(["state", "county", "doy"])
+    CELL_PATTERN = frozenset(["latitude", "longitude", "doy"])
+
+    def __init__(self, numeric_cols, bucket_days=14, cell_deg=0.5, min_count=20):
+        self.numeric_cols = numeric_cols
+        self.bucket_days = bucket_days
+        self.cell_deg = cell_deg
+        self.min_count = min_count
+        self.county_index, self.county_values, self.county_cols = {}, None, []
+        self.cell_index, self.cell_values, self.cell_cols = {}, None, []
+        self.cell_names = None
+
+    @staticmethod
+    def county_key(state, county, doy, bucket_days):
+        """(state, county, DOY bucket) key, also used by the lookup model tier (app/model_tiers.py)."""
+        return _norm_name(state), _norm_name(county), _doy_bucket(doy, bucket_days)
+
+    def _bucket(self, doy):
+        return _doy_bucket(doy, self.bucket_days)
+
+    def _cell(self, lat, lon):
+        return int(np.floor(float(lat) / self.cell_deg)), int(np.floor(float(lon) / self.cell_deg))
+
+    @classmethod
+    def build(cls, df, numeric_cols, bucket_days=14, cell_deg=0.5, min_count=20):
+        lookup = cls(numeric_cols, bucket_days, cell_deg, min_count)
+
+        base = df[df["doy"].notna()].copy()
+        base["_bucket"] = ((base["doy"].round() - 1) // bucket_days).astype(int)
+        medians = df[numeric_cols].median()
+
+        # (state, county, doy bucket) -> numerics + county centroid
+        by_county = base[base["state"].notna() & base["county"].notna()].copy()
+        by_county["_state"] = by_county["state"].map(_norm_name)
+        by_county["_county"] = by_county["county"].map(_norm_name)
+        lookup.county_cols = numeric_cols + ["latitude", "longitude"]
+        lookup.county_index, lookup.county_values, _ = lookup._aggregate(
+            by_county, ["_state", "_county", "_bucket"], lookup.county_cols, medians)
+
+        # (lat cell, lon cell, doy bucket) -> numerics + most common state/county
+        by_cell = base[base["latitude"].notna() & base["longitude"].notna()].copy()
+        by_cell["_lat"] = np.floor(by_cell["latitude"] / cell_deg).astype(int)
+        by_cell["_lon"] = np.floor(by_cell["longitude"] / cell_deg).astype(int)
+        lookup.cell_cols = list(numeric_cols)
+        lookup.cell_index, lookup.cell_values, keys = lookup._aggregate(
+            by_cell, ["_lat", "_lon", "_bucket"], lookup.cell_cols, medians)
+
+        modes = (
+            by_cell.groupby(["_lat", "_lon", "_bucket", "state", "county"], observed=True)
+            .size().reset_index(name="n")
+            .sort_values("n")
+            .drop_duplicates(["_lat", "_lon", "_bucket"], keep="last")
+            .set_index(["_lat", "_lon", "_bucket"])
+        )
+        lookup.cell_names = modes.reindex(keys)[["state", "county"]].to_numpy(dtype=object)
+
+        print(f"Sparse lookup: {len(lookup.county_index)} county keys, {len(lookup.cell_index)} cell keys")
+        return lookup
+
+    def _aggregate(self, df, keys, cols, medians):
+        grouped = df.groupby(keys, observed=True, sort=False)
+        counts = grouped.size()
+        means = grouped[cols].mean()
+        means = means[counts.reindex(means.index) >= self.min_count]
+        means = means.fillna(medians.reindex(cols))
+        index = {key: i for i, key in enumerate(means.index)}
+        return index, means.to_numpy(dtype=float), means.index
+
+    def lookup(self, user_json):
+        """Return a {column: value} fill for a sparse input, or None if KNN should handle it."""
+        provided = frozenset(k for k, v in user_json.items() if not _is_missing(v))
+
+        if provided == self.COUNTY_PATTERN:
+            key = self.county_key(user_json["state"], user_json["county"], user_json["doy"], self.bucket_days)
+            row = self.county_index.get(key)
+            if row is None:
+                return None
+            return dict(zip(self.county_cols, self.county_values[row]))
+
+        if provided == self.CELL_PATTERN:
+            key = (*self._cell(user_json["latitude"], user_json["longitude"]), self._bucket(user_json["doy"]))
+            row = self.cell_index.get(key)
+            if row is None:
+                return None
+            hit = dict(zip(self.cell_cols, self.cell_values[row]))
+            hit["state"], hit["county"] = self.cell_names[row]
+            return hit
+
+        return None
+
+
 class WildfireImputer:
-    def __init__(self, df, numeric_cols, geo_block, scaler, knn_index, k=10):
+    def __init__(self, df, numeric_cols, geo_block, scaler, knn_index, k=10, reducer=None, sparse_lookup=None):
         self.df = df
         self.numeric_cols = numeric_cols
         self.geo_block = geo_block
         self.scaler = scaler
         self.knn_index = knn_index
         self.k = k
+        # optional projection (e.g. PCA) applied to scaled numerics before the KNN lookup
+        self.reducer = reducer
+        # optional SparseLookup serving common sparse inputs without a KNN query
+        self.sparse_lookup = sparse_lookup
+
+    def _knn_space(self, scaled):
+        # getattr: imputers pickled before `reducer` existed have no such attribute
+        reducer = getattr(self, "reducer", None)
+        return reducer.transform(scaled) if reducer is not None else scaled
 
     def transform(self, user_json, round_risk=False):
+        result, _ = self.transform_incremental(user_json, round_risk=round_risk)
+        return result
+
+    def transform_incremental(self, user_json, round_risk=False, previous=None, reuse_threshold=0.0):
+        """
+        `transform` that also returns its KNN state ({"scaled", "indices"}, or None when the
+        sparse lookup answered) so the caller can pass it back as `previous` next time.
+        The previous neighbor set is reused when no scaled numeric moved by more than
+        `reuse_threshold` (in standard-scaler units); otherwise a new KNN query runs.
+        """
         user_df = pd.DataFrame([user_json], columns=self.df.columns)
 
+        # sparse inputs (state/county/doy or lat/lon/doy) are served from precomputed aggregates
+        sparse_lookup = getattr(self, "sparse_lookup", None)
+        hit = sparse_lookup.lookup(user_json) if sparse_lookup is not None else None
+        if hit is not None:
+            risk_val = self._fill_from_lookup(user_df, hit)
+            return self._finalize(user_df, risk_val, round_risk), None
+
         temp_num = user_df[self.numeric_cols].fillna(self.df[self.numeric_cols].median())
-        temp_num_scaled = self.scaler.transform(temp_num)
+        scaled = self.scaler.transform(temp_num)
+        if previous is not None and np.max(np.abs(scaled - previous["scaled"])) <= reuse_threshold:
+            state = previous
+        else:
+            distances, indices = self.knn_index.kneighbors(self._knn_space(scaled), n_neighbors=self.k)
+            state = {"scaled": scaled, "indices": indices[0]}
 
-        distances, indices = self.knn_index.kneighbors(temp_num_scaled, n_neighbors=self.k)
-        neighbor_values = self.df.iloc[indices[0]]
+        risk_val = self._fill_from_neighbors(user_df, user_json, self.df.iloc[state["indices"]])
+        return self._finalize(user_df, risk_val, round_risk), state
+
+    def _fill_from_lookup(self, user_df, hit):
+        for col in self.numeric_cols:
+            if pd.isna(user_df.loc[0, col]):
+                user_df.loc[0, col] = hit[col]
+        for col in self.geo_block:
+            if pd.isna(user_df.loc[0, col]):
+                if col in ["state", "county"]:
+                    user_df[col] = user_df[col].astype("object")
+                user_df.loc[0, col] = hit[col]
+        return hit.get("risk")
 
+    def _fill_from_neighbors(self, user_df, user_json, neighbor_values):
         # numeric fill
         for col in self.numeric_cols:
             if pd.isna(user_df.loc[0, col]):
@@ -45,6 +199,15 @@ class WildfireImputer:
                     user_df[col] = user_df[col].astype("object")
                 user_df.loc[0, col] = nearest[col]
 
+        return neighbor_values["risk"].mean() if "risk" in self.df.columns else None
+
+    def _prefire_p99(self):
+        # computed once per process instead of on every request
+        if getattr(self, "_prefire_p99_cache", None) is None:
+            self._prefire_p99_cache = self.df["prefire_fuel"].quantile(0.99)
+        return self._prefire_p99_cache
+
+    def _finalize(self, user_df, risk_val, round_risk):
         # derived DOY features
         if "doy" in user_df.columns and not pd.isna(user_df.loc[0, "doy"]):
             doy = int(round(user_df.loc[0, "doy"]))
@@ -58,12 +221,11 @@ class WildfireImputer:
 
         # prefire_fuel clip
         if "prefire_fuel" in user_df.columns and not pd.isna(user_df.loc[0, "prefire_fuel"]):
-            p99 = self.df["prefire_fuel"].quantile(0.99)
+            p99 = self._prefire_p99()
             user_df.loc[0, "prefire_fuel"] = min(user_df.loc[0, "prefire_fuel"], p99)
 
         # risk
         if "risk" in user_df.columns:
-            risk_val = neighbor_values["risk"].mean()
             user_df.loc[0, "risk"] = int(round(risk_val)) if round_risk else risk_val
 
         # enforce integer categories
@@ -74,3 +236,71 @@ class WildfireImputer:
                 user_df.loc[0, col] = int(round(user_df.loc[0, col]))
 
         return user_df.iloc[0].to_dict()
+
+    def transform_frame(self, frame, round_risk=False):
+        """
+        Batch version of `transform` for offline scoring: one KNN query for the whole
+        frame instead of one per row. Follows the KNN path of `transform` row for row
+        (the sparse lookup is skipped; bulk inputs are full historical records).
+        """
+        out = frame.reindex(columns=self.df.columns).reset_index(drop=True)
+        for col in ["state", "county"]:
+            if col in out.columns:
+                out[col] = out[col].astype("object")
+
+        num = out[self.numeric_cols].astype(float)
+        temp_num_scaled = self.scaler.transform(num.fillna(self.df[self.numeric_cols].median()))
+        distances, indices = self.knn_index.kneighbors(self._knn_space(temp_num_scaled), n_neighbors=self.k)
+
+        # numeric fill with neighbor means
+        train_num = self.df[self.numeric_cols].to_numpy(dtype=float)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)  # all-NaN neighbor columns
+            neighbor_means = np.nanmean(train_num[indices], axis=1)
+        values = num.to_numpy()
+        out[self.numeric_cols] = np.where(np.isnan(values), neighbor_means, values)
+
+        # geo-block logic
+        nearest = self.df.iloc[indices[:, 0]].reset_index(drop=True)
+        has_place = out["state"].notna() & out["county"].notna() & (out["state"] != "") & (out["county"] != "")
+        missing_latlon = out["latitude"].isna() | out["longitude"].isna()
+        for col in ["latitude", "longitude"]:
+            take = ~has_place | missing_latlon
+            out.loc[take, col] = nearest.loc[take, col]
+        for col in self.geo_block:
+            if col not in ["latitude", "longitude"]:
+                out.loc[~has_place, col] = nearest.loc[~has_place, col]
+
+        # derived DOY features
+        if "doy" in out.columns:
+            has_doy = out["doy"].notna()
+            doy = np.round(out.loc[has_doy, "doy"].astype(float))
+            out.loc[has_doy, "doy"] = doy
+            out.loc[has_doy, "day_of_year_sin"] = np.sin(2 * np.pi * doy / 365.25)
+            out.loc[has_doy, "day_of_year_cos"] = np.cos(2 * np.pi * doy / 365.25)
+            if "month" in out.columns:
+                fill_month = has_doy & out["month"].isna()
+                dates = pd.Timestamp("2020-01-01") + pd.to_timedelta(out.loc[fill_month, "doy"] - 1, unit="D")
+                out.loc[fill_month, "month"] = dates.dt.month
+            if "season" in out.columns:
+                out.loc[has_doy, "season"] = (np.trunc(out.loc[has_doy, "month"].astype(float)) % 12 // 3) + 1
+
+        # prefire_fuel clip
+        if "prefire_fuel" in out.columns:
+            out["prefire_fuel"] = out["prefire_fuel"].clip(upper=self._prefire_p99())
+
+        # risk
+        if "risk" in out.columns:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                risk = np.nanmean(self.df["risk"].to_numpy(dtype=float)[indices], axis=1)
+            out["risk"] = np.round(risk) if round_risk else risk
+
+        # enforce integer categories
+        int_cats = ["covertype", "fuelcode", "fuel_moisture_class", "burn_source",
+                    "burnday_source", "BSEV", "month", "season", "doy"]
+        for col in int_cats:
+            if col in out.columns:
+                out[col] = np.round(out[col].astype(float))
+
+        return out
@@ -1,12 +1,48 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Header, Query, Request
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 from app.imputer import impute_features
-from app.model_download import xgb_best_model, xgb_hazard_model, random_forest_model
-from app import risk_heatmap, emissions
+from app.model_download import xgb_best_model, xgb_hazard_model, tier_bundle
+from app.model_tiers import TierSelector
+from app.scoring import risk_event_filters
+from app.admission import AdmissionError, Deadline, risk_events_limiter, PREDICT_TIMEOUT
+from app.query_planner import ScanBudgetExceeded
+from app import risk_heatmap, emissions, diagnostics, tracked_fires, query_planner, bigquery_utils
 
 app = FastAPI(title="Wildfire API", version="1.0")
 
+# The API queries the clustered BigQuery tables; fail at startup rather than on every query
+query_planner.require_tables(bigquery_utils.client)
+
+# full / compact / lookup model tiers for /predict
+tier_selector = TierSelector(xgb_best_model, xgb_hazard_model, impute_features, tier_bundle)
+
+# Opt-in per-request profiling (see app/diagnostics.py); a no-op unless DIAGNOSTICS_TOKEN is set
+app.middleware("http")(diagnostics.diagnostics_middleware)
+
+
+# ---------- BigQuery bytes accounting ----------
+@app.middleware("http")
+async def bigquery_bytes_header(request: Request, call_next):
+    scan = query_planner.start_request_scan()
+    response = await call_next(request)
+    if scan["queries"]:
+        response.headers["X-BigQuery-Bytes-Processed"] = str(scan["bytes"])
+    return response
+
+
+# ---------- Load shedding ----------
+@app.exception_handler(AdmissionError)
+def admission_error_handler(request: Request, exc: AdmissionError):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 # ---------- Request Models ----------
 class ImputeRequest(BaseModel):
     features: Dict[str, Any]
@@ -27,73 +63,52 @@ def impute_endpoint(request: ImputeRequest):
 
 
 
-def map_duration_to_risk(duration: float) -> float:
-    if duration >= 10:
-        # Map duration ≥ 10 into [6, 10], capped at 10
-        return min(10, 6 + (duration - 10) / 20 * 4)
-        # every +20 days adds ~4 risk, but max at 10
-    elif duration >= 5:
-        # Map duration [5,10) → risk [3,6]
-        return 3 + (duration - 5) / 5 * 3
-    elif duration >= 1:
-        # Map duration [1,5) → risk [1,3]
-        return 1 + (duration - 1) / 4 * 2
-    else:
-        # Map duration [0,1) → risk [0,1]
-        return max(0, min(1, duration*2.5))
-
-
-
 # ---------- Prediction Endpoint ----------
 @app.post("/predict")
-def predict_endpoint(request: ImputeRequest):
-    import pandas as pd
+def predict_endpoint(
+        request: ImputeRequest,
+        latency_budget_ms: Optional[float] = Query(None, description="Latency budget used to pick a model tier"),
+        x_latency_budget_ms: Optional[float] = Header(None),
+        x_request_timeout: Optional[float] = Header(None)
+):
     from app.bigquery_utils import fetch_risk_events
 
-    # Step 1: impute missing features
-    imputed = impute_features(request.features, round_risk=request.round_risk)
+    deadline = Deadline.from_header(x_request_timeout, PREDICT_TIMEOUT)
 
-    # Step 2: drop excluded columns
-    exclude_cols = ['duration', 'global_fire_event_id', 'state', 'county', 'end_tomorrow', 'risk']
-    feature_vector = {k: v for k, v in imputed.items() if k not in exclude_cols}
+    with tier_selector.track():
+        budget_ms = latency_budget_ms if latency_budget_ms is not None else x_latency_budget_ms
+        tier = tier_selector.choose(budget_ms)
 
-    X = pd.DataFrame([feature_vector])
-
-    # Step 3: predictions
-    duration_pred = abs(float(xgb_best_model.predict(X)[0]))
-    proba = xgb_hazard_model.predict_proba(X)
-    end_probability = float(proba[0, 1])  # probability fire continues tomorrow
-    end_label = int(end_probability >= 0.5)
+        # Step 1-3: impute missing features (skipped by the lookup tier) and predict with the chosen tier
+        started = time.perf_counter()
+        imputed, predictions = tier_selector.run(tier, request.features, round_risk=request.round_risk)
+        tier_selector.record(tier, started)
 
     # Step 4: determine query filters for risk events
-    state = request.features.get("state")
-    county = request.features.get("county")
-    doy = request.features.get("doy") or imputed.get("doy")
-    season = request.features.get("season") or imputed.get("season")
+    filters = risk_event_filters(request.features, imputed)
 
     # Step 5: fetch historical risk events from BigQuery
-    risk_events = fetch_risk_events(
-        state=state,
-        county=county,
-        season=season,
-        doy=doy,
-        risk=imputed.get("risk")
-    )
-    risk_adjusted = map_duration_to_risk(duration_pred)
-    if risk_adjusted>10:
-        risk_adjusted= 8.97645
+    # Under overload (or over the scan budget) the predictions are still returned, just without risk_events
+    degraded = None
+    try:
+        with risk_events_limiter.admit(deadline):
+            risk_events = fetch_risk_events(**filters, risk=imputed.get("risk"), deadline=deadline)
+    except (AdmissionError, ScanBudgetExceeded) as e:
+        risk_events = None
+        degraded = {"risk_events": e.detail}
+
     # Final response
-    return {
+    response = {
         "input": request.features,
         "imputed": imputed,
-        "predictions": {
-            "duration": duration_pred,
-            "end_tomorrow_prob": end_probability,
-            "end_tomorrow_label": end_label,
-            "adjusted_risk": risk_adjusted
-        },
-        "risk_events": risk_events
+        "predictions": predictions,
+        "model_tier": tier
     }
+    if degraded:
+        response["degraded"] = degraded
+    else:
+        response["risk_events"] = risk_events
+    return response
 
 
 # @app.post("/predict-r")
@@ -156,4 +171,10 @@ app.include_router(risk_heatmap.router)
 
 # include emission router
 # The existing include should work, but make sure it's there
-app.include_router(emissions.router, prefix="/api", tags=["emissions"])
\ No newline at end of file
+app.include_router(emissions.router, prefix="/api", tags=["emissions"])
+
+# tracked fires (incremental re-prediction)
+app.include_router(tracked_fires.router, tags=["tracked fires"])
+
+# admin-only request diagnostics
+app.include_router(diagnostics.router, prefix="/admin", tags=["admin"], include_in_schema=False)
@@ -22,6 +22,18 @@ def download_if_needed(model_name: str):
     return local_path
 
 
+def download_optional(model_name: str):
+    """Like download_if_needed, but returns None when the artifact does not exist yet."""
+    try:
+        return download_if_needed(model_name)
+    except Exception as e:
+        print(f"Optional model {model_name} not available: {e}")
+        local_path = os.path.join(LOCAL_MODEL_DIR, model_name)
+        if os.path.exists(local_path) and os.path.getsize(local_path) == 0:
+            os.remove(local_path)
+        return None
+
+
 # Suppress sklearn/xgboost warnings while loading
 with warnings.catch_warnings():
     warnings.simplefilter("ignore", category=UserWarning)
@@ -29,9 +41,10 @@ with warnings.catch_warnings():
     warnings.simplefilter("ignore", category=Warning)  # broad filter if needed
 
     xgb_best_path = download_if_needed("xgb_best_model.pkl")
-    random_forest_model_path = download_if_needed("RandomForestRegressor_model.pkl")
     xgb_hazard_path = download_if_needed("xgb_hazard_calibrated.pkl")
+    # compact + lookup tiers built by app/train_tiers.py
+    tier_bundle_path = download_optional("tier_models.pkl")
 
     xgb_best_model = joblib.load(xgb_best_path)
-    random_forest_model = joblib.load(random_forest_model_path)
     xgb_hazard_model = joblib.load(xgb_hazard_path)
+    tier_bundle = joblib.load(tier_bundle_path) if tier_bundle_path else None
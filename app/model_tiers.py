@@ -0,0 +1,171 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+
+from app.imputer_model import SparseLookup, _is_missing
+from app.scoring import predict_one, map_duration_to_risk
+
+# Tiers from most to least accurate
+TIERS = ["full", "compact", "lookup"]
+
+# Overload thresholds for automatic downgrades (full -> compact, 2x -> lookup)
+TIER_MAX_INFLIGHT = int(os.getenv("TIER_MAX_INFLIGHT", "16"))
+TIER_P99_MS = float(os.getenv("TIER_P99_MS", "500"))
+# Observed samples needed before a tier's own p99 replaces the offline benchmark estimate
+TIER_MIN_SAMPLES = 20
+# Latency samples older than this are dropped, so a tier that stopped being chosen
+# after a slow spell falls back to its benchmark estimate instead of staying frozen
+TIER_WINDOW_SECONDS = float(os.getenv("TIER_WINDOW_SECONDS", "60"))
+
+
+class ProbabilityRegressor:
+    """Wraps a regressor distilled on hazard probabilities so it exposes predict_proba."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict_proba(self, X):
+        p = np.clip(self.model.predict(X), 0.0, 1.0)
+        return np.column_stack([1 - p, p])
+
+
+class LookupTier:
+    """
+    Full-model predictions averaged per (state, county, DOY bucket), with a global default.
+    Keyed off the raw request, so this tier skips imputation as well as the models.
+    """
+
+    def __init__(self, table, default, bucket_days=14):
+        self.table = table
+        self.default = default
+        self.bucket_days = bucket_days
+
+    @staticmethod
+    def key(state, county, doy, bucket_days):
+        if any(_is_missing(v) for v in (state, county, doy)):
+            return None
+        return SparseLookup.county_key(state, county, doy, bucket_days)
+
+    def predict(self, features):
+        key = self.key(features.get("state"), features.get("county"), features.get("doy"), self.bucket_days)
+        duration, end_probability = self.table.get(key, self.default)
+        return {
+            "duration": float(duration),
+            "end_tomorrow_prob": float(end_probability),
+            "end_tomorrow_label": int(end_probability >= 0.5),
+            "adjusted_risk": map_duration_to_risk(duration)
+        }
+
+
+class LatencyWindow:
+    """Last `size` latency samples, ignoring any older than `max_age` seconds."""
+
+    def __init__(self, size=500, max_age=TIER_WINDOW_SECONDS):
+        self._samples = deque(maxlen=size)
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+    def record(self, ms):
+        with self._lock:
+            self._samples.append((time.monotonic(), ms))
+
+    def _recent(self):
+        cutoff = time.monotonic() - self.max_age
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            return [ms for _, ms in self._samples]
+
+    def __len__(self):
+        return len(self._recent())
+
+    def p99(self):
+        samples = self._recent()
+        return float(np.percentile(samples, 99)) if samples else 0.0
+
+
+class TierSelector:
+    """
+    Picks the most accurate model tier that fits a request's latency budget,
+    and steps down automatically when in-flight requests or p99 cross thresholds.
+    `bundle` is the optional tier_models.pkl built by app/train_tiers.py; without it
+    only the full tier is available. `impute` turns request features into the imputed
+    vector the full and compact tiers score.
+    """
+
+    def __init__(self, duration_model, hazard_model, impute, bundle=None):
+        self.impute = impute
+        self.models = {"full": (duration_model, hazard_model)}
+        self.priors = {}
+        if bundle:
+            self.models["compact"] = (bundle["compact_duration"], bundle["compact_hazard"])
+            self.models["lookup"] = bundle["lookup"]
+            self.priors = {tier: stats["latency_ms_p99"] for tier, stats in bundle.get("benchmark", {}).items()}
+
+        self.available = [t for t in TIERS if t in self.models]
+        self.windows = {t: LatencyWindow() for t in self.available}
+        self.overall = LatencyWindow()
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def estimate_ms(self, tier):
+        window = self.windows[tier]
+        if len(window) >= TIER_MIN_SAMPLES:
+            return window.p99()
+        return self.priors.get(tier, 0.0)
+
+    def overload_level(self):
+        p99 = self.overall.p99() if len(self.overall) >= TIER_MIN_SAMPLES else 0.0
+        if self.in_flight > 2 * TIER_MAX_INFLIGHT or p99 > 2 * TIER_P99_MS:
+            return 2
+        if self.in_flight > TIER_MAX_INFLIGHT or p99 > TIER_P99_MS:
+            return 1
+        return 0
+
+    def choose(self, budget_ms=None):
+        candidates = self.available[min(self.overload_level(), len(self.available) - 1):]
+        if budget_ms is None:
+            return candidates[0]
+        for tier in candidates:
+            if self.estimate_ms(tier) <= budget_ms:
+                return tier
+        return candidates[-1]
+
+    def run(self, tier, features, round_risk=False):
+        """
+        Impute + predict one request with `tier`, returning (imputed, predictions).
+        This is the span both the live windows and app/train_tiers.py time. The lookup
+        tier skips imputation, so its `imputed` is just the request features.
+        """
+        if tier == "lookup":
+            return dict(features), self.models["lookup"].predict(features)
+        imputed = self.impute(features, round_risk=round_risk)
+        duration_model, hazard_model = self.models[tier]
+        return imputed, predict_one(imputed, duration_model, hazard_model)
+
+    @contextmanager
+    def track(self):
+        """Count a request as in flight; the caller records its latency with `record`."""
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def record(self, tier, started):
+        ms = 1000 * (time.perf_counter() - started)
+        self.windows[tier].record(ms)
+        self.overall.record(ms)
+
+    def stats(self):
+        return {
+            "available": self.available,
+            "in_flight": self.in_flight,
+            "overload_level": self.overload_level(),
+            "p99_ms": {t: self.windows[t].p99() for t in self.available},
+        }
@@ -0,0 +1,193 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from fastapi import HTTPException
+from google.api_core import exceptions as api_exceptions
+from google.cloud import bigquery
+
+# ---------- Tables ----------
+# The API reads the clustered copies built by app/build_clustered_tables.py. They carry
+# state_norm / county_norm columns so name filters compare cluster keys directly.
+# main.py refuses to start until they exist (require_tables).
+RISK_SOURCE_TABLE = "code-for-planet.data_housee.featured_data_risk_csv"
+RISK_CLUSTERED_TABLE = "code-for-planet.data_housee.featured_data_risk_clustered"
+EMISSIONS_SOURCE_TABLE = "code-for-planet.data_housee.wildfire_event_emissions_clean"
+EMISSIONS_CLUSTERED_TABLE = "code-for-planet.data_housee.wildfire_event_emissions_clustered"
+
+RISK_TABLE = RISK_CLUSTERED_TABLE
+EMISSIONS_TABLE = EMISSIONS_CLUSTERED_TABLE
+
+# Integer-range partition columns of the clustered copies
+PARTITION_COLUMNS = ("doy", "year")
+
+
+def require_tables(bq_client):
+    """Fail fast if the clustered copies the API queries have not been built yet."""
+    missing = []
+    for table in (RISK_TABLE, EMISSIONS_TABLE):
+        try:
+            bq_client.get_table(table)
+        except api_exceptions.NotFound:
+            missing.append(table)
+    if missing:
+        raise RuntimeError(f"BigQuery tables {missing} not found; "
+                           f"build them with `python -m app.build_clustered_tables`")
+
+# ---------- Name normalization ----------
+# Python and SQL versions must agree: "  los angeles county " -> "LOS ANGELES"
+_NAME_SUFFIX = r"\s+(COUNTY|PARISH|BOROUGH|CENSUS AREA)$"
+
+
+def normalize_name(value):
+    if value is None:
+        return None
+    name = re.sub(r"\s+", " ", str(value).strip().upper())
+    return re.sub(_NAME_SUFFIX, "", name)
+
+
+def normalized_name_sql(column):
+    return (f"REGEXP_REPLACE(REGEXP_REPLACE(UPPER(TRIM({column})), r'\\s+', ' '), "
+            f"r'{_NAME_SUFFIX}', '')")
+
+
+class FilterBuilder:
+    """
+    Builds a WHERE clause + query parameters. Every predicate leaves the column bare so
+    it stays sargable; state/county filters compare normalized names against the
+    precomputed *_norm cluster columns.
+    """
+
+    def __init__(self):
+        self.filters = []
+        self.params = []
+
+    def name_eq(self, column, value):
+        self.filters.append(f"{column}_norm = @{column}")
+        self.params.append(bigquery.ScalarQueryParameter(column, "STRING", normalize_name(value)))
+        return self
+
+    def name_contains(self, column, value):
+        # substring match, kept for routes that always matched partial names
+        self.filters.append(f"{column}_norm LIKE @{column}")
+        self.params.append(bigquery.ScalarQueryParameter(column, "STRING", f"%{normalize_name(value)}%"))
+        return self
+
+    def eq(self, column, value, type_):
+        self.filters.append(f"{column} = @{column}")
+        self.params.append(bigquery.ScalarQueryParameter(column, type_, value))
+        return self
+
+    def between(self, column, value, radius, type_):
+        self.filters.append(f"{column} BETWEEN @{column}_lo AND @{column}_hi")
+        self.params.append(bigquery.ScalarQueryParameter(f"{column}_lo", type_, value - radius))
+        self.params.append(bigquery.ScalarQueryParameter(f"{column}_hi", type_, value + radius))
+        return self
+
+    def raw(self, predicate):
+        self.filters.append(predicate)
+        return self
+
+    def where(self):
+        return f"WHERE {' AND '.join(self.filters)}" if self.filters else ""
+
+    def job_config(self):
+        return bigquery.QueryJobConfig(query_parameters=self.params) if self.params else None
+
+
+# ---------- Scan budgets ----------
+GB = 1024 ** 3
+SCAN_BUDGETS = {
+    "risk_events": int(float(os.getenv("BQ_BUDGET_RISK_EVENTS_GB", "2")) * GB),
+    "emissions": int(float(os.getenv("BQ_BUDGET_EMISSIONS_GB", "5")) * GB),
+    "emissions_summary": int(float(os.getenv("BQ_BUDGET_EMISSIONS_SUMMARY_GB", "5")) * GB),
+    "emissions_counties": int(float(os.getenv("BQ_BUDGET_EMISSIONS_COUNTIES_GB", "2")) * GB),
+    "emissions_states": int(float(os.getenv("BQ_BUDGET_EMISSIONS_STATES_GB", "10")) * GB),
+    "emissions_years": int(float(os.getenv("BQ_BUDGET_EMISSIONS_YEARS_GB", "10")) * GB),
+}
+BQ_DRY_RUN = os.getenv("BQ_DRY_RUN", "1") == "1"
+DRY_RUN_CACHE_SIZE = 1024
+
+
+class ScanBudgetExceeded(HTTPException):
+    def __init__(self, route, estimated, budget):
+        super().__init__(
+            status_code=400,
+            detail=f"Query for {route} would scan {estimated / GB:.2f} GB, over its "
+                   f"{budget / GB:.2f} GB budget; narrow the filters",
+        )
+
+
+_dry_run_cache = OrderedDict()
+_dry_run_lock = threading.Lock()
+
+
+def _is_partition_param(name):
+    return any(name == column or name.startswith(f"{column}_") for column in PARTITION_COLUMNS)
+
+
+def _cache_key(query, job_config):
+    # only partition-column values change how much a query scans (partitions differ in
+    # size); other values such as state or county share the query shape's estimate
+    params = job_config.query_parameters if job_config else []
+    return query, tuple((p.name, p.type_, p.value if _is_partition_param(p.name) else None) for p in params)
+
+
+def estimate_bytes(bq_client, query, job_config=None, timeout=None):
+    """Dry-run a query for its bytes-processed estimate (cached per query shape + partition values)."""
+    key = _cache_key(query, job_config)
+    with _dry_run_lock:
+        if key in _dry_run_cache:
+            _dry_run_cache.move_to_end(key)
+            return _dry_run_cache[key]
+
+    dry_config = bigquery.QueryJobConfig(
+        dry_run=True,
+        use_query_cache=False,
+        query_parameters=job_config.query_parameters if job_config else [],
+    )
+    estimated = bq_client.query(query, job_config=dry_config, timeout=timeout).total_bytes_processed or 0
+
+    with _dry_run_lock:
+        _dry_run_cache[key] = estimated
+        while len(_dry_run_cache) > DRY_RUN_CACHE_SIZE:
+            _dry_run_cache.popitem(last=False)
+    return estimated
+
+
+def check_budget(bq_client, route, query, job_config=None, timeout=None):
+    budget = SCAN_BUDGETS.get(route)
+    if not BQ_DRY_RUN or budget is None:
+        return None
+    estimated = estimate_bytes(bq_client, query, job_config, timeout)
+    if estimated > budget:
+        print(f"[bq] route={route} rejected: estimated {estimated} bytes > budget {budget}")
+        raise ScanBudgetExceeded(route, estimated, budget)
+    return estimated
+
+
+# ---------- Bytes-scanned accounting ----------
+_request_scan = ContextVar("bq_request_scan", default=None)
+scan_totals = {}
+_totals_lock = threading.Lock()
+
+
+def start_request_scan():
+    """Begin per-request accounting; queries run in this context add to the returned dict."""
+    scan = {"queries": 0, "bytes": 0}
+    _request_scan.set(scan)
+    return scan
+
+
+def record_scan(route, bytes_processed):
+    bytes_processed = bytes_processed or 0
+    scan = _request_scan.get()
+    if scan is not None:
+        scan["queries"] += 1
+        scan["bytes"] += bytes_processed
+    with _totals_lock:
+        totals = scan_totals.setdefault(route, {"queries": 0, "bytes": 0})
+        totals["queries"] += 1
+        totals["bytes"] += bytes_processed
+    print(f"[bq] route={route} bytes_processed={bytes_processed}")
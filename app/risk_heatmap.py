@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Header
 from typing import Optional
 from app.bigquery_utils import fetch_risk_events
+from app.admission import Deadline, risk_events_limiter, RISK_HEATMAP_TIMEOUT
 
 router = APIRouter()
 
@@ -10,11 +11,14 @@ def get_risk_heatmap(
     county: Optional[str] = Query(None, description="County name"),
     season: Optional[int] = Query(None, description="Season (1=Winter,2=Spring,3=Summer,4=Fall)"),
     doy: Optional[int] = Query(None, description="Day of year (1-365)"),
-    limit: int = Query(5000, description="Max number of events to return")
+    limit: int = Query(5000, description="Max number of events to return"),
+    x_request_timeout: Optional[float] = Header(None)
 ):
     """
     Returns wildfire events (lat/lon + risk) filtered by state/county/season/doy.
     Automatically adapts result size to historical density.
     """
-    events = fetch_risk_events(state, county, season, doy, limit)
+    deadline = Deadline.from_header(x_request_timeout, RISK_HEATMAP_TIMEOUT)
+    with risk_events_limiter.admit(deadline):
+        events = fetch_risk_events(state, county, season, doy, limit=limit, deadline=deadline)
     return {"events": events, "count": len(events)}
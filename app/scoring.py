@@ -0,0 +1,67 @@
+# Shared between /predict and offline scoring (app/bulk_score.py)
+import numpy as np
+import pandas as pd
+
+# Columns present in the imputed vector that the duration/hazard models were not trained on
+MODEL_EXCLUDE_COLS = ['duration', 'global_fire_event_id', 'state', 'county', 'end_tomorrow', 'risk']
+
+
+def map_duration_to_risk(duration: float) -> float:
+    if duration >= 10:
+        # Map duration ≥ 10 into [6, 10], capped at 10
+        return min(10, 6 + (duration - 10) / 20 * 4)
+        # every +20 days adds ~4 risk, but max at 10
+    elif duration >= 5:
+        # Map duration [5,10) → risk [3,6]
+        return 3 + (duration - 5) / 5 * 3
+    elif duration >= 1:
+        # Map duration [1,5) → risk [1,3]
+        return 1 + (duration - 1) / 4 * 2
+    else:
+        # Map duration [0,1) → risk [0,1]
+        return max(0, min(1, duration*2.5))
+
+
+def predict_one(imputed, duration_model, hazard_model):
+    """Model step of /predict for one imputed feature dict."""
+    feature_vector = {k: v for k, v in imputed.items() if k not in MODEL_EXCLUDE_COLS}
+    X = pd.DataFrame([feature_vector])
+
+    duration_pred = abs(float(duration_model.predict(X)[0]))
+    proba = hazard_model.predict_proba(X)
+    end_probability = float(proba[0, 1])  # probability fire continues tomorrow
+    end_label = int(end_probability >= 0.5)
+
+    risk_adjusted = map_duration_to_risk(duration_pred)
+    if risk_adjusted>10:
+        risk_adjusted= 8.97645
+    return {
+        "duration": duration_pred,
+        "end_tomorrow_prob": end_probability,
+        "end_tomorrow_label": end_label,
+        "adjusted_risk": risk_adjusted
+    }
+
+
+def risk_event_filters(features, imputed):
+    """Query filters for fetch_risk_events: user-given state/county, doy/season falling back to imputed."""
+    return {
+        "state": features.get("state"),
+        "county": features.get("county"),
+        "season": features.get("season") or imputed.get("season"),
+        "doy": features.get("doy") or imputed.get("doy"),
+    }
+
+
+def score_frame(imputed, duration_model, hazard_model):
+    """Batch equivalent of the /predict model step for an imputed DataFrame."""
+    X = imputed.drop(columns=[c for c in MODEL_EXCLUDE_COLS if c in imputed.columns])
+    duration = np.abs(duration_model.predict(X).astype(float))
+    end_probability = hazard_model.predict_proba(X)[:, 1].astype(float)
+
+    return pd.DataFrame({
+        "pred_duration": duration,
+        "end_tomorrow_prob": end_probability,
+        "end_tomorrow_label": (end_probability >= 0.5).astype(int),
+        "adjusted_risk": [map_duration_to_risk(d) for d in duration],
+    }, index=imputed.index)
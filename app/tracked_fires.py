@@ -0,0 +1,134 @@
+import os
+import time
+import uuid
+from typing import Optional, Dict, Any
+import pandas as pd
+from fastapi import APIRouter, Header
+from pydantic import BaseModel
+
+from app.imputer import wildfire_imputer, clean_for_json
+from app.model_download import xgb_best_model, xgb_hazard_model
+from app.scoring import predict_one, risk_event_filters
+from app.bigquery_utils import query_risk_events, downsample_risk_events, adaptive_limit
+from app.admission import AdmissionError, Deadline, risk_events_limiter, PREDICT_TIMEOUT
+from app.query_planner import ScanBudgetExceeded
+from app.fire_store import make_store
+
+# Reuse the stored neighbor set while no scaled numeric moved more than this (std units)
+NEIGHBOR_REUSE_THRESHOLD = float(os.getenv("NEIGHBOR_REUSE_THRESHOLD", "0.25"))
+
+router = APIRouter()
+
+
+class TrackFireRequest(BaseModel):
+    features: Dict[str, Any]
+    round_risk: Optional[bool] = False
+
+
+class FireDeltaRequest(BaseModel):
+    # changed fields only; a null value clears the field so it is imputed again
+    features: Dict[str, Any]
+
+
+store = make_store()
+
+
+def _update(fire, features, deadline):
+    """Recompute a fire's outputs, redoing only what changed features invalidate."""
+    imputed, knn_state = wildfire_imputer.transform_incremental(
+        features,
+        round_risk=fire["round_risk"],
+        previous=fire.get("knn_state"),
+        reuse_threshold=NEIGHBOR_REUSE_THRESHOLD,
+    )
+    imputed = clean_for_json(imputed)
+    recomputed = {
+        "neighbors": knn_state is not None and knn_state is not fire.get("knn_state"),
+        "risk_events": False,
+    }
+
+    predictions = predict_one(imputed, xgb_best_model, xgb_hazard_model)
+
+    # risk events are queried again only when the filters change; the rows are kept before
+    # downsampling, so a new risk-based sample size is applied locally without a query
+    filters = risk_event_filters(features, imputed)
+    degraded = None
+    if filters != fire.get("risk_filters"):
+        try:
+            with risk_events_limiter.admit(deadline):
+                rows = query_risk_events(**filters, deadline=deadline)
+            fire["risk_rows"] = rows.to_dict(orient="list")
+            fire["risk_filters"] = filters
+            recomputed["risk_events"] = True
+        except (AdmissionError, ScanBudgetExceeded) as e:
+            # filters left unset so the next update retries the fetch
+            fire["risk_rows"] = None
+            fire["risk_filters"] = None
+            degraded = {"risk_events": e.detail}
+    fire["risk_limit"] = adaptive_limit(imputed.get("risk"), filters["doy"])
+
+    fire.update({
+        "features": features,
+        "imputed": imputed,
+        "knn_state": knn_state,
+        "predictions": predictions,
+        "updated_at": time.time(),
+    })
+    return _response(fire, recomputed, degraded)
+
+
+def _response(fire, recomputed=None, degraded=None):
+    response = {
+        "fire_id": fire["fire_id"],
+        "input": fire["features"],
+        "imputed": fire["imputed"],
+        "predictions": fire["predictions"],
+        "updated_at": fire["updated_at"],
+    }
+    if recomputed is not None:
+        response["recomputed"] = recomputed
+    if degraded:
+        response["degraded"] = degraded
+    elif fire.get("risk_rows") is not None:
+        response["risk_events"] = downsample_risk_events(pd.DataFrame(fire["risk_rows"]), fire["risk_limit"])
+    return response
+
+
+@router.post("/fires")
+def track_fire(request: TrackFireRequest, x_request_timeout: Optional[float] = Header(None)):
+    """Start tracking a fire: same output as /predict plus a fire_id for later updates."""
+    deadline = Deadline.from_header(x_request_timeout, PREDICT_TIMEOUT)
+    fire = {"fire_id": uuid.uuid4().hex, "round_risk": request.round_risk}
+    response = _update(fire, dict(request.features), deadline)
+    store.put(fire["fire_id"], fire)
+    return response
+
+
+@router.patch("/fires/{fire_id}")
+def update_fire(fire_id: str, request: FireDeltaRequest, x_request_timeout: Optional[float] = Header(None)):
+    """
+    Apply feature deltas to a tracked fire. The KNN search reruns only when scaled
+    numerics moved past NEIGHBOR_REUSE_THRESHOLD, and risk events are refetched only
+    when state/county/season/doy changed. A concurrent update to the same fire makes
+    this one fail with 409.
+    """
+    deadline = Deadline.from_header(x_request_timeout, PREDICT_TIMEOUT)
+    fire, version = store.get(fire_id)
+    features = {**fire["features"], **request.features}
+    features = {k: v for k, v in features.items() if v is not None}
+    response = _update(fire, features, deadline)
+    store.put(fire_id, fire, version)
+    return response
+
+
+@router.get("/fires/{fire_id}")
+def get_fire(fire_id: str):
+    """Latest stored prediction for a tracked fire."""
+    fire, _ = store.get(fire_id)
+    return _response(fire)
+
+
+@router.delete("/fires/{fire_id}")
+def delete_fire(fire_id: str):
+    store.delete(fire_id)
+    return {"message": f"Stopped tracking fire {fire_id}"}
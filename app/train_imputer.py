@@ -5,8 +5,9 @@ import joblib
 from google.cloud import storage
 from sklearn.preprocessing import StandardScaler
 from sklearn.neighbors import NearestNeighbors
+from sklearn.decomposition import PCA
 
-from app.imputer_model import WildfireImputer  # <-- IMPORTANT: ensures pickle saves correctly
+from app.imputer_model import WildfireImputer, SparseLookup  # <-- IMPORTANT: ensures pickle saves correctly
 
 
 def load_data():
@@ -29,7 +30,14 @@ def load_data():
     return df
 
 
-def train_imputer(df):
+def train_imputer(df, k=10, n_components=None, precompute_sparse=True):
+    """
+    Build a WildfireImputer over `df`.
+    If n_components is set, the scaled numerics are projected with PCA to that many
+    dimensions (an int, or a float in (0, 1) for explained-variance ratio) before indexing.
+    If precompute_sparse is set, aggregates for state/county/doy and lat/lon/doy inputs
+    are materialized so those requests skip the KNN query.
+    """
     # Feature definitions
     drop_cols = ["duration", "global_fire_event_id"]
     feature_cols = [c for c in df.columns if c not in drop_cols]
@@ -51,9 +59,20 @@ def train_imputer(df):
     X_all = df[numeric_cols].fillna(df[numeric_cols].median())
     X_all_scaled = scaler.transform(X_all)
 
+    # Optionally reduce the KNN space
+    reducer = None
+    if n_components:
+        reducer = PCA(n_components=n_components, random_state=42)
+        X_all_scaled = reducer.fit_transform(X_all_scaled)
+        print(f"PCA: {reducer.n_components_} components, "
+              f"{reducer.explained_variance_ratio_.sum():.3f} explained variance")
+
     knn_index = NearestNeighbors(metric="euclidean")
     knn_index.fit(X_all_scaled)
 
+    # Precompute lookups for the common sparse inputs
+    sparse_lookup = SparseLookup.build(df, numeric_cols) if precompute_sparse else None
+
     # Build custom imputer
     wildfire_imputer = WildfireImputer(
         df=df,
@@ -61,7 +80,9 @@ def train_imputer(df):
         geo_block=geo_block,
         scaler=scaler,
         knn_index=knn_index,
-        k=10,
+        k=k,
+        reducer=reducer,
+        sparse_lookup=sparse_lookup,
     )
 
     return wildfire_imputer
@@ -84,7 +105,19 @@ def save_and_upload(model, local_path="models/wildfire_imputer.pkl"):
     print(f"Uploaded model to gs://{bucket_name}/{blob_path}")
 
 
+def parse_components(value):
+    """'12' -> 12 components, '0.95' -> keep 95% variance, ''/None -> no reduction."""
+    if not value:
+        return None
+    return float(value) if "." in value else int(value)
+
+
 if __name__ == "__main__":
     df = load_data()
-    imputer = train_imputer(df)
+    # Pick these with app/tune_imputer.py
+    imputer = train_imputer(
+        df,
+        k=int(os.getenv("IMPUTER_K", "10")),
+        n_components=parse_components(os.getenv("IMPUTER_PCA_COMPONENTS")),
+    )
     save_and_upload(imputer)
@@ -0,0 +1,141 @@
+"""
+Build and benchmark the fallback model tiers used by /predict.
+
+- compact: small XGBoost models distilled from the full duration and hazard models
+- lookup:  full-model predictions averaged per (state, county, DOY bucket)
+
+Training rows are imputed with the production imputer and labelled by the full models.
+Each tier is then benchmarked on a held-out split: error against the full model
+(duration MAE, probability MAE, label agreement) and single-request latency (mean/p99).
+Latency covers TierSelector.run on the raw request, imputation included, which is the
+same span /predict records. The p99s are saved in the bundle and used as latency
+estimates until the server has its own measurements.
+
+Example:
+    python -m app.train_tiers --rows 200000 --bench-rows 1000
+"""
+import os
+import time
+import argparse
+import joblib
+import numpy as np
+import pandas as pd
+from xgboost import XGBRegressor
+from google.cloud import storage
+
+from app.train_imputer import load_data
+from app.scoring import MODEL_EXCLUDE_COLS
+from app.model_tiers import ProbabilityRegressor, LookupTier, TierSelector
+
+BUCKET_NAME = "data_housee"
+BLOB_PATH = "wildfire_ml_models/tier_models.pkl"
+
+
+def teacher_labels(imputed, duration_model, hazard_model):
+    X = imputed.drop(columns=[c for c in MODEL_EXCLUDE_COLS if c in imputed.columns])
+    duration = np.abs(duration_model.predict(X).astype(float))
+    end_probability = hazard_model.predict_proba(X)[:, 1].astype(float)
+    return X, duration, end_probability
+
+
+def build_compact(X, duration, end_probability, n_estimators=60, max_depth=4):
+    params = dict(n_estimators=n_estimators, max_depth=max_depth, learning_rate=0.15,
+                  tree_method="hist", n_jobs=1, random_state=42)
+    compact_duration = XGBRegressor(**params).fit(X, duration)
+    compact_hazard = ProbabilityRegressor(XGBRegressor(objective="reg:logistic", **params).fit(X, end_probability))
+    return compact_duration, compact_hazard
+
+
+def build_lookup(raw, duration, end_probability, bucket_days=14, min_count=5):
+    # keyed off the raw rows, as the lookup tier sees requests before any imputation
+    keys = [LookupTier.key(s, c, d, bucket_days)
+            for s, c, d in zip(raw["state"], raw["county"], raw["doy"])]
+    frame = pd.DataFrame({"key": keys, "duration": duration, "prob": end_probability})
+    frame = frame[frame["key"].notna()]
+    grouped = frame.groupby("key").agg(duration=("duration", "mean"), prob=("prob", "mean"), n=("prob", "size"))
+    grouped = grouped[grouped["n"] >= min_count]
+    table = {key: (row.duration, row.prob) for key, row in grouped.iterrows()}
+    default = (float(np.median(duration)), float(np.median(end_probability)))
+    print(f"Lookup tier: {len(table)} keys")
+    return LookupTier(table, default, bucket_days)
+
+
+def benchmark(selector, records):
+    """Per-tier error vs the full tier and per-request latency over raw request records."""
+    results, reference = {}, None
+    for name in selector.available:
+        latencies, preds = [], []
+        for features in records:
+            start = time.perf_counter()
+            preds.append(selector.run(name, features)[1])
+            latencies.append(1000 * (time.perf_counter() - start))
+
+        duration = np.array([p["duration"] for p in preds])
+        prob = np.array([p["end_tomorrow_prob"] for p in preds])
+        label = np.array([p["end_tomorrow_label"] for p in preds])
+        if reference is None:
+            reference = (duration, prob, label)
+
+        results[name] = {
+            "duration_mae": float(np.mean(np.abs(duration - reference[0]))),
+            "prob_mae": float(np.mean(np.abs(prob - reference[1]))),
+            "label_agreement": float(np.mean(label == reference[2])),
+            "latency_ms_mean": float(np.mean(latencies)),
+            "latency_ms_p99": float(np.percentile(latencies, 99)),
+        }
+    return results
+
+
+def save_and_upload(bundle, local_path="models/tier_models.pkl", upload=True):
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    joblib.dump(bundle, local_path)
+    print(f"Saved tier bundle locally at {local_path}")
+    if not upload:
+        return
+
+    storage_client = storage.Client()
+    bucket = storage_client.bucket(BUCKET_NAME)
+    bucket.blob(BLOB_PATH).upload_from_filename(local_path)
+    print(f"Uploaded tier bundle to gs://{BUCKET_NAME}/{BLOB_PATH}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and benchmark compact/lookup model tiers")
+    parser.add_argument("--rows", type=int, default=200000, help="Training rows sampled from the dataset")
+    parser.add_argument("--bench-rows", type=int, default=1000, help="Held-out rows for the benchmark")
+    parser.add_argument("--no-upload", action="store_true")
+    args = parser.parse_args()
+
+    from app.imputer import wildfire_imputer, impute_features
+    from app.model_download import xgb_best_model, xgb_hazard_model
+
+    df = load_data()
+    df = df.sample(n=min(args.rows + args.bench_rows, len(df)), random_state=42).reset_index(drop=True)
+    raw = df.drop(columns=["duration", "global_fire_event_id", "risk"], errors="ignore")
+    train_raw, bench_raw = raw.iloc[args.bench_rows:], raw.iloc[:args.bench_rows]
+
+    imputed = wildfire_imputer.transform_frame(train_raw)
+    X, duration, end_probability = teacher_labels(imputed, xgb_best_model, xgb_hazard_model)
+
+    compact_duration, compact_hazard = build_compact(X, duration, end_probability)
+    lookup = build_lookup(train_raw, duration, end_probability)
+
+    bundle = {
+        "compact_duration": compact_duration,
+        "compact_hazard": compact_hazard,
+        "lookup": lookup,
+    }
+
+    # benchmark on requests as /predict sees them: one raw feature dict at a time
+    bench_records = [{k: v for k, v in r.items() if not pd.isna(v)}
+                     for r in bench_raw.to_dict(orient="records")]
+    selector = TierSelector(xgb_best_model, xgb_hazard_model, impute_features, bundle)
+    results = benchmark(selector, bench_records)
+    print(pd.DataFrame(results).T.to_string())
+
+    bundle["benchmark"] = results
+    save_and_upload(bundle, upload=not args.no_upload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Fidelity-vs-latency harness for the KNN imputer.
+
+For every (dims, k) in the grid it trains an imputer on a training split, masks known
+numeric values on a held-out split, and reports:
+  - imputation RMSE on the masked cells (in standard-scaler units)
+  - downstream XGBoost duration error (|pred(imputed) - pred(true features)|), with --with-model
+  - per-query transform latency (mean / p95) and KNN index memory
+
+Example:
+    python -m app.tune_imputer --dims 0 8 16 --k 5 10 20 --queries 300 --max-error 0.8
+
+dims=0 means the full scaled space (no PCA).
+"""
+import argparse
+import pickle
+import time
+import numpy as np
+import pandas as pd
+
+from app.train_imputer import load_data, train_imputer
+from app.scoring import MODEL_EXCLUDE_COLS
+
+
+def split_holdout(df, holdout_frac=0.1, seed=42):
+    holdout = df.sample(frac=holdout_frac, random_state=seed)
+    train = df.drop(holdout.index).reset_index(drop=True)
+    return train, holdout.reset_index(drop=True)
+
+
+def mask_rows(holdout, numeric_cols, mask_frac=0.5, seed=42):
+    """Return (queries, masks): each query is a row dict with a random subset of known numerics set to None."""
+    rng = np.random.default_rng(seed)
+    queries, masks = [], []
+    for _, row in holdout.iterrows():
+        known = [c for c in numeric_cols if not pd.isna(row[c])]
+        n_mask = max(1, int(len(known) * mask_frac)) if known else 0
+        masked = list(rng.choice(known, size=n_mask, replace=False)) if n_mask else []
+
+        query = {k: (None if pd.isna(v) else v) for k, v in row.items()}
+        query.pop("duration", None)
+        query.pop("global_fire_event_id", None)
+        query.pop("risk", None)
+        for col in masked:
+            query[col] = None
+        queries.append(query)
+        masks.append(masked)
+    return queries, masks
+
+
+def index_nbytes(imputer):
+    """Serialized size of the KNN index plus the optional reducer."""
+    size = len(pickle.dumps(imputer.knn_index, protocol=pickle.HIGHEST_PROTOCOL))
+    if getattr(imputer, "reducer", None) is not None:
+        size += len(pickle.dumps(imputer.reducer, protocol=pickle.HIGHEST_PROTOCOL))
+    return size
+
+
+def model_frame(rows):
+    return pd.DataFrame([{k: v for k, v in r.items() if k not in MODEL_EXCLUDE_COLS} for r in rows])
+
+
+def evaluate(imputer, holdout, queries, masks, k, duration_model=None):
+    imputer.k = k
+    scale = dict(zip(imputer.numeric_cols, imputer.scaler.scale_))
+
+    latencies, sq_errors, imputed_rows = [], [], []
+    for (_, truth), query, masked in zip(holdout.iterrows(), queries, masks):
+        start = time.perf_counter()
+        imputed = imputer.transform(query)
+        latencies.append(time.perf_counter() - start)
+        imputed_rows.append(imputed)
+
+        for col in masked:
+            err = (float(imputed[col]) - float(truth[col])) / (scale[col] or 1.0)
+            sq_errors.append(err * err)
+
+    result = {
+        "imputation_rmse": float(np.sqrt(np.mean(sq_errors))) if sq_errors else float("nan"),
+        "latency_ms_mean": 1000 * float(np.mean(latencies)),
+        "latency_ms_p95": 1000 * float(np.percentile(latencies, 95)),
+    }
+
+    if duration_model is not None:
+        truth_rows = holdout.to_dict(orient="records")
+        pred_imputed = np.abs(duration_model.predict(model_frame(imputed_rows)))
+        pred_truth = np.abs(duration_model.predict(model_frame(truth_rows)))
+        result["duration_mae"] = float(np.mean(np.abs(pred_imputed - pred_truth)))
+
+    return result
+
+
+def run_grid(df, dims_grid, k_grid, n_queries=500, mask_frac=0.5, holdout_frac=0.1, duration_model=None):
+    train, holdout = split_holdout(df, holdout_frac)
+    holdout = holdout.head(n_queries)
+
+    results = []
+    for dims in dims_grid:
+        imputer = train_imputer(train, n_components=dims or None, precompute_sparse=False)
+        queries, masks = mask_rows(holdout, imputer.numeric_cols, mask_frac)
+        nbytes = index_nbytes(imputer)
+        for k in k_grid:
+            row = {"pca": dims, "dims": dims or len(imputer.numeric_cols), "k": k, "index_mb": nbytes / 1e6}
+            row.update(evaluate(imputer, holdout, queries, masks, k, duration_model))
+            print(row)
+            results.append(row)
+    return pd.DataFrame(results)
+
+
+def pick_fastest(results, max_error, error_col="imputation_rmse"):
+    """Fastest configuration whose error is within max_error, or None."""
+    ok = results[results[error_col] <= max_error]
+    if ok.empty:
+        return None
+    return ok.sort_values(["latency_ms_mean", "index_mb"]).iloc[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Imputer fidelity-vs-latency tuning harness")
+    parser.add_argument("--dims", type=int, nargs="+", default=[0, 8, 16],
+                        help="PCA dimensions to try (0 = full scaled space)")
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--queries", type=int, default=500, help="Held-out rows to impute per config")
+    parser.add_argument("--mask-frac", type=float, default=0.5, help="Share of known numerics to mask per row")
+    parser.add_argument("--holdout-frac", type=float, default=0.1)
+    parser.add_argument("--with-model", action="store_true", help="Also report XGBoost duration error")
+    parser.add_argument("--max-error", type=float, default=None, help="Accuracy bar for picking a config")
+    parser.add_argument("--error-col", default="imputation_rmse", choices=["imputation_rmse", "duration_mae"])
+    parser.add_argument("--out", default=None, help="Optional CSV path for the results table")
+    args = parser.parse_args()
+
+    duration_model = None
+    if args.with_model:
+        from app.model_download import xgb_best_model
+        duration_model = xgb_best_model
+
+    df = load_data()
+    results = run_grid(df, args.dims, args.k, args.queries, args.mask_frac, args.holdout_frac, duration_model)
+
+    print(results.to_string(index=False))
+    if args.out:
+        results.to_csv(args.out, index=False)
+        print(f"Saved results to {args.out}")
+
+    if args.max_error is not None:
+        best = pick_fastest(results, args.max_error, args.error_col)
+        if best is None:
+            print(f"No configuration meets {args.error_col} <= {args.max_error}")
+        else:
+            print(f"Fastest config within bar: dims={int(best['dims'])}, k={int(best['k'])} "
+                  f"({best['latency_ms_mean']:.2f} ms/query, {best['index_mb']:.1f} MB)")
+            pca = f" IMPUTER_PCA_COMPONENTS={int(best['pca'])}" if best["pca"] else ""
+            print(f"Train with: IMPUTER_K={int(best['k'])}{pca} python -m app.train_imputer")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import re
+import sys
+import importlib
+import pandas as pd
+import pytest
+from google.api_core import exceptions as api_exceptions
+from google.cloud import bigquery
+
+from app import query_planner
+from app.admission import Deadline, DeadlineExceeded
+from app.query_planner import (
+    GB, FilterBuilder, ScanBudgetExceeded, normalize_name, normalized_name_sql,
+)
+
+
+class FakeJob:
+    def __init__(self, total_bytes_processed, rows):
+        self.total_bytes_processed = total_bytes_processed
+        self.rows = rows
+        self.cancelled = False
+
+    def result(self, timeout=None):
+        return self
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.rows)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeClient:
+    """Local stand-in for bigquery.Client: records every call, dry runs return `estimate`."""
+
+    def __init__(self, *args, estimate=1 * GB, processed=1000, rows=None, tables=None, **kwargs):
+        self.estimate = estimate
+        self.processed = processed
+        self.rows = rows if rows is not None else {"risk": [1.0]}
+        self.tables = tables
+        self.calls = []
+
+    def get_table(self, table):
+        if self.tables is not None and table not in self.tables:
+            raise api_exceptions.NotFound(f"Table {table} not found")
+        return table
+
+    def query(self, query, job_config=None, timeout=None):
+        dry_run = bool(job_config and job_config.dry_run)
+        self.calls.append({"query": query, "job_config": job_config, "timeout": timeout, "dry_run": dry_run})
+        if dry_run:
+            return FakeJob(self.estimate, None)
+        return FakeJob(self.processed, self.rows)
+
+    @property
+    def dry_runs(self):
+        return [c for c in self.calls if c["dry_run"]]
+
+    @property
+    def jobs(self):
+        return [c for c in self.calls if not c["dry_run"]]
+
+
+@pytest.fixture(autouse=True)
+def clean_planner(monkeypatch):
+    monkeypatch.setattr(query_planner, "BQ_DRY_RUN", True)
+    query_planner._dry_run_cache.clear()
+    query_planner.scan_totals.clear()
+    query_planner._request_scan.set(None)
+    yield
+    query_planner._dry_run_cache.clear()
+    query_planner.scan_totals.clear()
+
+
+@pytest.fixture
+def bigquery_utils(monkeypatch):
+    # app.bigquery_utils builds a client at import time; import it against the stand-in
+    monkeypatch.setattr(bigquery, "Client", FakeClient)
+    sys.modules.pop("app.bigquery_utils", None)
+    yield importlib.import_module("app.bigquery_utils")
+    sys.modules.pop("app.bigquery_utils", None)
+
+
+def _state_filter(state):
+    return FilterBuilder().name_eq("state", state)
+
+
+# ---------- Budgets ----------
+def test_check_budget_rejects_over_budget():
+    client = FakeClient(estimate=50 * GB)
+    with pytest.raises(ScanBudgetExceeded) as exc:
+        query_planner.check_budget(client, "risk_events", "SELECT 1")
+    assert exc.value.status_code == 400
+    assert "risk_events" in exc.value.detail
+
+
+def test_check_budget_passes_under_budget_and_skips_unknown_routes():
+    client = FakeClient(estimate=1024)
+    assert query_planner.check_budget(client, "risk_events", "SELECT 1") == 1024
+    assert query_planner.check_budget(client, "no_such_route", "SELECT 2") is None
+    assert len(client.dry_runs) == 1
+
+
+def test_check_budget_disabled(monkeypatch):
+    monkeypatch.setattr(query_planner, "BQ_DRY_RUN", False)
+    client = FakeClient(estimate=50 * GB)
+    assert query_planner.check_budget(client, "risk_events", "SELECT 1") is None
+    assert client.calls == []
+
+
+def test_run_query_rejected_query_never_runs(bigquery_utils):
+    client = FakeClient(estimate=50 * GB)
+    filters = _state_filter("CA")
+    with pytest.raises(ScanBudgetExceeded):
+        bigquery_utils.run_query(client, "SELECT 1", filters.job_config(), route="risk_events")
+    assert client.jobs == []
+
+
+# ---------- Dry-run cache ----------
+def test_dry_run_cached_per_query_shape(bigquery_utils):
+    client = FakeClient()
+    for state in ["CA", "OR", "CA"]:
+        filters = _state_filter(state)
+        bigquery_utils.run_query(client, "SELECT 1 " + filters.where(), filters.job_config(), route="risk_events")
+    assert len(client.dry_runs) == 1
+    assert len(client.jobs) == 3
+
+    # a different query shape is dry-run on its own
+    filters = _state_filter("CA").eq("season", 2, "INT64")
+    bigquery_utils.run_query(client, "SELECT 1 " + filters.where(), filters.job_config(), route="risk_events")
+    assert len(client.dry_runs) == 2
+
+
+@pytest.mark.parametrize("column, build", [
+    ("year", lambda value: FilterBuilder().eq("year", value, "INT64")),
+    ("doy", lambda value: FilterBuilder().between("doy", value, 7, "INT64")),
+])
+def test_dry_run_cached_per_partition_value(bigquery_utils, column, build):
+    client = FakeClient()
+    for value in [100, 200, 100]:
+        filters = build(value).name_eq("state", "CA")
+        bigquery_utils.run_query(client, "SELECT 1 " + filters.where(), filters.job_config(), route="emissions")
+    assert len(client.dry_runs) == 2
+
+
+def test_dry_run_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(query_planner, "DRY_RUN_CACHE_SIZE", 2)
+    client = FakeClient()
+    for i in range(3):
+        query_planner.estimate_bytes(client, f"SELECT {i}")
+    assert list(q for q, _ in query_planner._dry_run_cache) == ["SELECT 1", "SELECT 2"]
+
+
+# ---------- Deadlines ----------
+def test_expired_deadline_skips_dry_run(bigquery_utils):
+    client = FakeClient()
+    with pytest.raises(DeadlineExceeded):
+        bigquery_utils.run_query(client, "SELECT 1", deadline=Deadline(0), route="risk_events")
+    assert client.calls == []
+
+
+def test_dry_run_bounded_by_deadline(bigquery_utils):
+    client = FakeClient()
+    bigquery_utils.run_query(client, "SELECT 1", deadline=Deadline(5), route="risk_events")
+    dry_run, job = client.calls
+    assert dry_run["dry_run"] and 0 < dry_run["timeout"] <= 5
+    assert 0 < job["timeout"] <= 5
+    assert 0 < int(job["job_config"].job_timeout_ms) <= 5000
+
+
+# ---------- Bytes accounting ----------
+def test_record_scan_totals(bigquery_utils):
+    client = FakeClient(processed=300)
+    scan = query_planner.start_request_scan()
+    bigquery_utils.run_query(client, "SELECT 1", route="risk_events")
+    bigquery_utils.run_query(client, "SELECT 2", route="emissions")
+    bigquery_utils.run_query(client, "SELECT 3", route="emissions")
+
+    assert scan == {"queries": 3, "bytes": 900}
+    assert query_planner.scan_totals == {
+        "risk_events": {"queries": 1, "bytes": 300},
+        "emissions": {"queries": 2, "bytes": 600},
+    }
+
+
+def test_record_scan_without_request_context():
+    query_planner.record_scan("emissions", None)
+    assert query_planner.scan_totals == {"emissions": {"queries": 1, "bytes": 0}}
+
+
+# ---------- Filters ----------
+def test_filter_builder_names_are_case_insensitive():
+    filters = FilterBuilder().name_eq("state", "california").name_contains("county", "los angeles")
+    assert filters.where() == "WHERE state_norm = @state AND county_norm LIKE @county"
+    assert [p.value for p in filters.params] == ["CALIFORNIA", "%LOS ANGELES%"]
+
+
+def test_filter_builder_normalized_columns():
+    filters = (FilterBuilder()
+               .name_eq("county", "  los angeles county ")
+               .eq("year", 2020, "INT64")
+               .between("doy", 100, 7, "INT64"))
+    assert filters.where() == ("WHERE county_norm = @county AND year = @year "
+                               "AND doy BETWEEN @doy_lo AND @doy_hi")
+    assert {p.name: p.value for p in filters.params} == {
+        "county": "LOS ANGELES", "year": 2020, "doy_lo": 93, "doy_hi": 107}
+
+
+def test_filter_builder_empty():
+    filters = FilterBuilder()
+    assert filters.where() == ""
+    assert filters.job_config() is None
+
+
+def test_fetch_risk_events_query(bigquery_utils, monkeypatch):
+    client = FakeClient(rows={"latitude": [1.0], "longitude": [2.0], "state": ["CA"],
+                              "county": ["Butte"], "risk": [4.0]})
+    monkeypatch.setattr(bigquery_utils, "client", client)
+    events = bigquery_utils.fetch_risk_events(state="CA", county="Butte", doy=200, risk=4)
+
+    job = client.jobs[0]
+    names = FilterBuilder().name_eq("state", "CA").name_eq("county", "Butte").where()
+    assert names.replace("WHERE ", "") in job["query"]
+    assert "doy BETWEEN @doy_lo AND @doy_hi" in job["query"]
+    assert events == [{"latitude": 1.0, "longitude": 2.0, "state": "CA", "county": "Butte", "risk": 4.0}]
+
+
+# ---------- Startup check ----------
+def test_require_tables():
+    query_planner.require_tables(FakeClient(tables={query_planner.RISK_TABLE, query_planner.EMISSIONS_TABLE}))
+    with pytest.raises(RuntimeError, match="build_clustered_tables"):
+        query_planner.require_tables(FakeClient(tables={query_planner.RISK_TABLE}))
+
+
+# ---------- Name normalization ----------
+def _eval_normalized_name_sql(sql, value):
+    """Evaluate the UPPER/TRIM + nested REGEXP_REPLACE expression in Python."""
+    assert sql.startswith("REGEXP_REPLACE(REGEXP_REPLACE(UPPER(TRIM(")
+    result = value.strip().upper()
+    for pattern, replacement in re.findall(r"r'((?:[^'\\]|\\.)*)', '([^']*)'", sql):
+        result = re.sub(pattern, replacement, result)
+    return result
+
+
+@pytest.mark.parametrize("value", [
+    "California", "  los angeles county ", "Los  Angeles   County", "ORLEANS PARISH",
+    "Bethel Census Area", "county line", "Butte", "\tSan  Diego\n",
+])
+def test_normalize_name_matches_sql(value):
+    sql = normalized_name_sql("county")
+    assert _eval_normalized_name_sql(sql, value) == normalize_name(value)
+
+
+def test_normalize_name_none():
+    assert normalize_name(None) is None